@@ -0,0 +1,132 @@
+"""Session permissions, the signed-in user and the login/permission decorators"""
+from flask import request, redirect, url_for, flash, session, g
+from werkzeug.local import LocalProxy
+from functools import wraps
+from extensions import db, cache
+from models import Permission, User
+
+PERMISSION_VERSION_TTL = 60  # Seconds other workers may serve a stale permission version
+
+def _permission_version(user_id):
+    """The user's permission version, read from the DB at most once per TTL per worker"""
+    cache_key = f'permission_version_{user_id}'
+    version = cache.get(cache_key)
+    if version is None:
+        version = db.session.query(User.permission_version).filter(User.id == user_id).scalar()
+        if version is not None:
+            cache.set(cache_key, version, timeout=PERMISSION_VERSION_TTL)
+    return version
+
+def invalidate_permissions(user):
+    """Bump the user's permission version so every session reloads its permissions"""
+    user.permission_version = (user.permission_version or 0) + 1
+    cache.delete(f'permission_version_{user.id}')
+
+def current_permissions():
+    """Frozenset of the signed-in user's permission names, resolved once per request.
+    
+    Served from the session; the session copy is only rebuilt when the user's
+    permission version no longer matches. Returns None if the user no longer exists.
+    """
+    if '_permissions' in g:
+        return g._permissions
+    
+    user_id = session.get('user_id')
+    if user_id is None:
+        permissions = frozenset()
+    else:
+        version = _permission_version(user_id)
+        if version is None:
+            permissions = None
+        else:
+            if session.get('permission_version') != version:
+                update_session_permissions(user_id)
+            permissions = frozenset(session.get('permissions', []))
+    g._permissions = permissions
+    return permissions
+
+def check_permission(permission_name):
+    """Whether the signed-in user has a permission; admins have all of them"""
+    permissions = current_permissions()
+    if 'user_id' not in session or permissions is None:
+        return False
+    return session.get('is_admin', False) or permission_name in permissions
+
+# Login required decorator
+def login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' not in session:
+            return redirect(url_for('users.login'))
+        return f(*args, **kwargs)
+    return decorated_function
+
+# Permission required decorator
+def permission_required(permission_name):
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if 'user_id' not in session or current_permissions() is None:
+                return redirect(url_for('users.login'))
+            
+            if not check_permission(permission_name):
+                flash('You do not have permission to access this page')
+                return redirect(url_for('main.index'))
+            
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+# Admin required decorator
+def admin_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' not in session or current_permissions() is None:
+            return redirect(url_for('users.login'))
+        if not session.get('is_admin', False):
+            flash('Admin access required')
+            return redirect(url_for('main.index'))
+        return f(*args, **kwargs)
+    return decorated_function
+
+def get_current_user():
+    """The signed-in User with permissions joined in, loaded at most once per request"""
+    if '_current_user' not in g:
+        user_id = session.get('user_id')
+        g._current_user = User.query.options(db.joinedload(User.permissions)).filter(User.id == user_id).first() if user_id is not None else None
+    return g._current_user
+
+# Add helper function for getting user info
+def get_user(user_id):
+    if user_id is not None and user_id == session.get('user_id'):
+        return get_current_user()
+    return User.query.get(user_id)
+
+def utility_processor():
+    # current_user is only loaded if a template actually uses it
+    return {
+        'check_permission': check_permission,
+        'get_user': get_user,
+        'current_user': LocalProxy(get_current_user)
+    }
+
+def update_session_permissions(user_id):
+    """Update the session permissions for a user, stamped with their permission version"""
+    user = User.query.get(user_id)
+    if user:
+        if user.role == 'admin':
+            session['permissions'] = [p.name for p in Permission.query.all()]
+        else:
+            session['permissions'] = [p.name for p in user.permissions]
+        session['is_admin'] = user.role == 'admin'
+        session['permission_version'] = user.permission_version or 0
+        g.pop('_permissions', None)
+
+def require_login():
+    # List of routes that don't require login
+    public_routes = ['users.login', 'static', 'main.service_worker', 'main.manifest', 'main.offline']
+    
+    # Check if the requested endpoint is in public routes
+    if request.endpoint and request.endpoint not in public_routes:
+        if 'logged_in' not in session:
+            return redirect(url_for('users.login'))
@@ -0,0 +1,1001 @@
+"""Customers: search, ledger, payments, receivables and reconciliation"""
+from flask import Blueprint, render_template, request, jsonify, send_file, Response, stream_with_context
+from datetime import datetime, date, timedelta
+from sqlalchemy import func
+from io import BytesIO
+from collections import OrderedDict
+import io
+import csv
+import click
+from extensions import db, cache
+from models import Customer, CustomerTransaction, CustomerReceivable, Invoice
+from auth import login_required, permission_required, admin_required
+from helpers import _escape_like, _text
+
+bp = Blueprint('customers', __name__, cli_group=None)
+
+@bp.route('/customers')
+@login_required
+@permission_required('view_customers')
+def customers():
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', 50, type=int)
+    search = request.args.get('q', '').strip()
+    
+    # Invoice counts and last invoice dates in one grouped subquery rather than
+    # lazy-loading every customer's invoices
+    invoice_stats = db.session.query(
+        Invoice.customer_id,
+        func.count(Invoice.id).label('invoice_count'),
+        func.max(Invoice.date).label('last_invoice_date')
+    ).filter(Invoice.customer_id.isnot(None)).group_by(Invoice.customer_id).subquery()
+    
+    query = db.session.query(
+        Customer,
+        func.coalesce(invoice_stats.c.invoice_count, 0).label('invoice_count'),
+        invoice_stats.c.last_invoice_date
+    ).outerjoin(invoice_stats, invoice_stats.c.customer_id == Customer.id)
+    
+    if search:
+        # Prefix matches on lower(name) and phone, which the *_pattern indexes serve on PostgreSQL
+        prefix = _escape_like(search.lower()) + '%'
+        query = query.filter(db.or_(
+            func.lower(Customer.name).like(prefix, escape='\\'),
+            Customer.phone.like(prefix, escape='\\')
+        ))
+    
+    pagination = query.order_by(Customer.name, Customer.id).paginate(
+        page=page,
+        per_page=per_page,
+        error_out=False
+    )
+    
+    return render_template(
+        'customers.html',
+        customers=pagination.items,
+        pagination=pagination,
+        total_pages=pagination.pages,
+        total_items=pagination.total,
+        current_page=page,
+        search=search
+    )
+
+CUSTOMER_SEARCH_LIMIT = 10
+RECENT_CUSTOMERS_SIZE = 50
+_recent_customers = OrderedDict()  # id -> summary, most recently used last (per process)
+
+def _customer_summary(customer):
+    return {'id': customer.id, 'name': customer.name, 'phone': customer.phone}
+
+def remember_customer(customer):
+    """Mark a customer as recently used so typeahead can offer it without a query"""
+    _recent_customers.pop(customer.id, None)
+    _recent_customers[customer.id] = _customer_summary(customer)
+    while len(_recent_customers) > RECENT_CUSTOMERS_SIZE:
+        _recent_customers.popitem(last=False)
+
+def forget_customer(customer_id):
+    _recent_customers.pop(customer_id, None)
+
+@bp.route('/customers/search')
+@login_required
+def search_customers():
+    """Typeahead lookup of customers by name or phone.
+    
+    An empty query returns the recently used customers from memory. Otherwise
+    results are ranked: name prefix, phone prefix, word prefix within the name,
+    then fuzzy (trigram similarity on PostgreSQL, substring elsewhere).
+    """
+    query = request.args.get('q', '').strip()
+    limit = min(request.args.get('limit', CUSTOMER_SEARCH_LIMIT, type=int), 50)
+    
+    if not query:
+        return jsonify(list(reversed(_recent_customers.values()))[:limit])
+    
+    pattern = _escape_like(query.lower())
+    name_prefix = func.lower(Customer.name).like(f'{pattern}%', escape='\\')
+    phone_prefix = Customer.phone.like(f'{pattern}%', escape='\\')
+    word_prefix = Customer.name.ilike(f'% {pattern}%', escape='\\')
+    
+    if db.engine.dialect.name == 'postgresql':
+        # Uses the pg_trgm index on customer.name
+        fuzzy = Customer.name.op('%')(query)
+        similarity = func.similarity(Customer.name, query)
+    else:
+        fuzzy = Customer.name.ilike(f'%{pattern}%', escape='\\')
+        similarity = db.literal(0)
+    
+    rank = db.case((name_prefix, 0), (phone_prefix, 1), (word_prefix, 2), else_=3)
+    customers = db.session.query(Customer.id, Customer.name, Customer.phone, rank.label('rank')).filter(
+        db.or_(name_prefix, phone_prefix, word_prefix, fuzzy)
+    ).order_by(rank, similarity.desc(), Customer.name).limit(limit).all()
+    
+    # Within a rank, customers used recently come first
+    recent = {customer_id: position for position, customer_id in enumerate(reversed(_recent_customers))}
+    customers.sort(key=lambda customer: (customer.rank, recent.get(customer.id, len(recent))))
+    return jsonify([_customer_summary(customer) for customer in customers])
+
+@bp.route('/customers', methods=['POST'])
+@login_required
+def add_customer():
+    data = request.json
+    
+    # Server-side validation
+    if not data.get('name'):
+        return jsonify({'success': False, 'error': 'Name is required'})
+    
+    customer = Customer(
+        name=data['name'],
+        phone=data.get('phone'),
+        email=data.get('email'),
+        address=data.get('address')
+    )
+    
+    try:
+        db.session.add(customer)
+        db.session.commit()
+        return jsonify({'success': True, 'id': customer.id})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
+@bp.route('/customers/<int:id>')
+@login_required
+def customer_detail(id):
+    customer = Customer.query.get_or_404(id)
+    # The ledger is loaded page by page from /customers/<id>/ledger
+    invoice_count = db.session.query(func.count(Invoice.id)).filter(Invoice.customer_id == id).scalar()
+    invoices = Invoice.query.filter_by(customer_id=id).order_by(Invoice.date.desc(), Invoice.id.desc()).limit(RECENT_INVOICES_LIMIT).all()
+    return render_template('customer_detail.html', customer=customer, invoices=invoices, invoice_count=invoice_count)
+
+LEDGER_PAGE_SIZE = 50
+RECENT_INVOICES_LIMIT = 50  # Invoices listed on the customer page; older ones are in the ledger
+
+def _customer_ledger(customer_id):
+    """Receivables and transactions of one customer as a single date-ordered ledger.
+    
+    Returns a subquery with one row per entry and a running balance computed by a
+    window function, so any slice of it (a keyset page or a date range) carries the
+    correct balance without loading earlier entries.
+    """
+    receivables = db.select(
+        db.literal('receivable', db.String).label('entry_type'),
+        db.literal(0, db.Integer).label('entry_order'),
+        CustomerReceivable.id,
+        CustomerReceivable.date,
+        (CustomerReceivable.amount + func.coalesce(CustomerReceivable.additional_amount, 0)).label('debit'),
+        db.literal(0.0, db.Float).label('credit'),
+        CustomerReceivable.amount,
+        CustomerReceivable.additional_amount,
+        Invoice.order_number.label('invoice_number'),
+        db.cast(db.null(), db.String).label('payment_method'),
+        db.cast(db.null(), db.String).label('reference_number'),
+        CustomerReceivable.notes
+    ).outerjoin(Invoice, Invoice.id == CustomerReceivable.invoice_id).where(CustomerReceivable.customer_id == customer_id)
+    
+    transactions = db.select(
+        CustomerTransaction.transaction_type.label('entry_type'),
+        db.literal(1, db.Integer).label('entry_order'),
+        CustomerTransaction.id,
+        CustomerTransaction.date,
+        db.case((CustomerTransaction.transaction_type == 'refund', CustomerTransaction.amount), else_=0.0).label('debit'),
+        db.case((CustomerTransaction.transaction_type == 'payment', CustomerTransaction.amount), else_=0.0).label('credit'),
+        CustomerTransaction.amount,
+        db.cast(db.null(), db.Float).label('additional_amount'),
+        db.cast(db.null(), db.String).label('invoice_number'),
+        CustomerTransaction.payment_method,
+        CustomerTransaction.reference_number,
+        CustomerTransaction.notes
+    ).where(CustomerTransaction.customer_id == customer_id)
+    
+    entries = db.union_all(receivables, transactions).subquery()
+    return db.select(
+        entries,
+        func.sum(entries.c.debit - entries.c.credit).over(
+            order_by=(entries.c.date, entries.c.entry_order, entries.c.id)
+        ).label('balance')
+    ).subquery()
+
+def _ledger_cursor(entry):
+    return f"{entry.date.isoformat()}|{entry.entry_order}|{entry.id}"
+
+def _ledger_entry(entry):
+    return {
+        'entry_type': entry.entry_type,
+        'id': entry.id,
+        'date': entry.date.strftime('%Y-%m-%d %H:%M'),
+        'debit': round(entry.debit or 0, 2),
+        'credit': round(entry.credit or 0, 2),
+        'amount': entry.amount,
+        'additional_amount': entry.additional_amount,
+        'invoice_number': entry.invoice_number,
+        'payment_method': entry.payment_method,
+        'reference_number': entry.reference_number,
+        'notes': entry.notes,
+        'balance': round(entry.balance or 0, 2)
+    }
+
+def _ledger_range(args):
+    """Parse start_date/end_date (YYYY-MM-DD) into datetime bounds; either may be missing"""
+    start = datetime.strptime(args['start_date'], '%Y-%m-%d') if args.get('start_date') else None
+    end = datetime.strptime(args['end_date'], '%Y-%m-%d') + timedelta(days=1) if args.get('end_date') else None
+    return start, end
+
+@bp.route('/customers/<int:id>/ledger')
+@login_required
+@permission_required('view_customers')
+def customer_ledger(id):
+    """One page of the customer's ledger, newest first.
+    
+    Pages are keyset-based: pass the returned next_cursor as ?before= to get the
+    next (older) page.
+    """
+    Customer.query.get_or_404(id)
+    limit = min(request.args.get('limit', LEDGER_PAGE_SIZE, type=int), 500)
+    ledger = _customer_ledger(id)
+    order_key = db.tuple_(ledger.c.date, ledger.c.entry_order, ledger.c.id)
+    
+    query = db.select(ledger)
+    before = request.args.get('before')
+    if before:
+        try:
+            before_date, before_order, before_id = before.split('|')
+            query = query.where(order_key < db.tuple_(
+                datetime.fromisoformat(before_date), int(before_order), int(before_id)
+            ))
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Invalid cursor'}), 400
+    
+    rows = db.session.execute(
+        query.order_by(ledger.c.date.desc(), ledger.c.entry_order.desc(), ledger.c.id.desc()).limit(limit + 1)
+    ).all()
+    
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return jsonify({
+        'success': True,
+        'entries': [_ledger_entry(row) for row in rows],
+        'next_cursor': _ledger_cursor(rows[-1]) if has_more else None
+    })
+
+@bp.route('/customers/<int:id>/ledger/export')
+@login_required
+@permission_required('view_customers')
+def export_customer_ledger(id):
+    """Statement of the customer's ledger for a date range as CSV (streamed) or PDF"""
+    from invoice_pdf import render_statement_pdf
+    
+    customer = Customer.query.get_or_404(id)
+    try:
+        start, end = _ledger_range(request.args)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Dates must be in YYYY-MM-DD format'}), 400
+    
+    ledger = _customer_ledger(id)
+    query = db.select(ledger)
+    if start:
+        query = query.where(ledger.c.date >= start)
+    if end:
+        query = query.where(ledger.c.date < end)
+    query = query.order_by(ledger.c.date, ledger.c.entry_order, ledger.c.id)
+    
+    opening_balance = 0.0
+    if start:
+        opening_balance = db.session.query(
+            func.coalesce(func.sum(ledger.c.debit - ledger.c.credit), 0)
+        ).filter(ledger.c.date < start).scalar()
+    
+    filename = f"statement_{id}_{request.args.get('start_date', 'start')}_{request.args.get('end_date', 'today')}"
+    
+    if request.args.get('format') == 'pdf':
+        rows = [_ledger_entry(row) for row in db.session.execute(query)]
+        pdf = render_statement_pdf(customer.name, request.args.get('start_date'), request.args.get('end_date'), opening_balance, rows)
+        return send_file(BytesIO(pdf), mimetype='application/pdf', as_attachment=True, download_name=f'{filename}.pdf')
+    
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        
+        def flush():
+            data = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            return data
+        
+        writer.writerow(['Date', 'Type', 'Invoice', 'Method', 'Reference', 'Notes', 'Debit', 'Credit', 'Balance'])
+        writer.writerow(['', 'Opening balance', '', '', '', '', '', '', f'{opening_balance:.2f}'])
+        yield flush()
+        
+        # Rows are fetched in chunks so long statements aren't held in memory
+        for count, row in enumerate(db.session.execute(query.execution_options(yield_per=500)), start=1):
+            entry = _ledger_entry(row)
+            writer.writerow([
+                entry['date'], entry['entry_type'], entry['invoice_number'] or '', entry['payment_method'] or '',
+                entry['reference_number'] or '', entry['notes'] or '',
+                f"{entry['debit']:.2f}", f"{entry['credit']:.2f}", f"{entry['balance']:.2f}"
+            ])
+            if count % 500 == 0:
+                yield flush()
+        yield flush()
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={filename}.csv'}
+    )
+
+@bp.route('/customers/<int:id>', methods=['PUT', 'DELETE'])
+@login_required
+def update_customer(id):
+    customer = Customer.query.get_or_404(id)
+    
+    if request.method == 'PUT':
+        data = request.json
+        
+        # Server-side validation
+        if not data.get('name'):
+            return jsonify({'success': False, 'error': 'Name is required'})
+        
+        try:
+            customer.name = data['name']
+            customer.phone = data.get('phone')
+            customer.email = data.get('email')
+            customer.address = data.get('address')
+            
+            db.session.commit()
+            if customer.id in _recent_customers:
+                _recent_customers[customer.id] = _customer_summary(customer)
+            return jsonify({'success': True})
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': str(e)})
+    
+    elif request.method == 'DELETE':
+        try:
+            # Check if customer has any invoices
+            if customer.invoices:
+                return jsonify({'success': False, 'error': 'Cannot delete customer with existing invoices'})
+            
+            # Delete all transactions and receivables
+            CustomerTransaction.query.filter_by(customer_id=id).delete()
+            CustomerReceivable.query.filter_by(customer_id=id).delete()
+            
+            # Delete the customer
+            db.session.delete(customer)
+            db.session.commit()
+            forget_customer(id)
+            return jsonify({'success': True})
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': str(e)})
+
+@bp.route('/customers/payment', methods=['POST'])
+@login_required
+def add_customer_payment():
+    data = request.json
+    
+    # Server-side validation
+    if not all(key in data for key in ('customer_id', 'amount', 'payment_method')):
+        return jsonify({'success': False, 'error': 'Missing required fields'})
+    
+    try:
+        amount = float(data['amount'])
+        customer_id = int(data['customer_id'])
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid amount or customer ID'})
+    
+    customer = Customer.query.get_or_404(customer_id)
+    
+    transaction = CustomerTransaction(
+        customer_id=customer_id,
+        amount=amount,
+        transaction_type='payment',
+        payment_method=data['payment_method'],
+        reference_number=data.get('reference_number'),
+        notes=data.get('notes')
+    )
+    
+    try:
+        db.session.add(transaction)
+        Customer.adjust_balance(customer_id, CustomerTransaction.balance_effect('payment', amount))
+        allocate_payments([customer_id])
+        db.session.commit()
+        return jsonify({'success': True})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
+PAYMENT_BATCH_SIZE = 500  # Payments posted per transaction in bulk posting
+PAYMENT_METHODS = ('cash', 'card', 'upi', 'bank_transfer')
+
+def _parse_payment_date(value):
+    if value is None or value == '' or (isinstance(value, float) and value != value):
+        return datetime.utcnow()
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time())
+    if hasattr(value, 'to_pydatetime'):  # pandas Timestamp
+        return value.to_pydatetime()
+    return datetime.strptime(str(value).strip()[:10], '%Y-%m-%d')
+
+def post_payments(rows):
+    """Validate and post many customer payments, returning one result per row.
+    
+    Each row needs an amount and a customer given by customer_id or phone; an
+    optional payment_method, reference_number, notes and date may be supplied.
+    A row whose reference_number was already recorded for that customer is
+    reported as a duplicate, so re-importing a statement is safe.
+    
+    Rows are posted in batches of PAYMENT_BATCH_SIZE. Each batch is one
+    transaction with a bulk INSERT, one grouped balance UPDATE and one FIFO
+    allocation pass.
+    """
+    results = [None] * len(rows)
+    
+    ids = set()
+    phones = set()
+    for row in rows:
+        customer_id = _text(row.get('customer_id'))
+        if customer_id and customer_id.isdigit():
+            ids.add(int(customer_id))
+        elif _text(row.get('phone')):
+            phones.add(_text(row.get('phone')))
+    known_ids = {c.id for c in db.session.query(Customer.id).filter(Customer.id.in_(ids))} if ids else set()
+    by_phone = {}
+    if phones:
+        for customer in db.session.query(Customer.id, Customer.phone).filter(Customer.phone.in_(phones)):
+            by_phone.setdefault(customer.phone, []).append(customer.id)
+    
+    valid = []
+    for index, row in enumerate(rows):
+        customer_id = _text(row.get('customer_id'))
+        phone = _text(row.get('phone'))
+        try:
+            if customer_id:
+                customer_id = int(customer_id)
+                if customer_id not in known_ids:
+                    raise ValueError(f'Unknown customer {customer_id}')
+            elif phone:
+                matches = by_phone.get(phone, [])
+                if len(matches) != 1:
+                    raise ValueError(f'No customer with phone {phone}' if not matches else f'Several customers have phone {phone}')
+                customer_id = matches[0]
+            else:
+                raise ValueError('customer_id or phone is required')
+            
+            amount = round(float(str(row.get('amount', '')).replace(',', '')), 2)
+            if not amount > 0:
+                raise ValueError('Amount must be positive')
+            payment_method = (_text(row.get('payment_method')) or 'cash').lower().replace(' ', '_')
+            if payment_method not in PAYMENT_METHODS:
+                raise ValueError(f'Unknown payment method {payment_method}')
+            transaction_date = _parse_payment_date(row.get('date'))
+        except (TypeError, ValueError) as e:
+            results[index] = {'row': index + 1, 'status': 'error', 'error': str(e)}
+            continue
+        
+        valid.append((index, {
+            'customer_id': customer_id,
+            'amount': amount,
+            'transaction_type': 'payment',
+            'payment_method': payment_method,
+            'reference_number': _text(row.get('reference_number')),
+            'notes': _text(row.get('notes')),
+            'date': transaction_date
+        }))
+    
+    for start in range(0, len(valid), PAYMENT_BATCH_SIZE):
+        batch = valid[start:start + PAYMENT_BATCH_SIZE]
+        to_insert = []
+        transaction_ids = []
+        try:
+            references = {values['reference_number'] for _, values in batch if values['reference_number']}
+            seen = set()
+            if references:
+                seen = set(db.session.query(CustomerTransaction.customer_id, CustomerTransaction.reference_number).filter(
+                    CustomerTransaction.transaction_type == 'payment',
+                    CustomerTransaction.reference_number.in_(references)
+                ).all())
+            
+            for index, values in batch:
+                key = (values['customer_id'], values['reference_number'])
+                if values['reference_number'] and key in seen:
+                    results[index] = {'row': index + 1, 'status': 'duplicate', 'customer_id': values['customer_id']}
+                    continue
+                seen.add(key)
+                to_insert.append((index, values))
+            
+            if to_insert:
+                transaction_ids = db.session.scalars(
+                    db.insert(CustomerTransaction).returning(CustomerTransaction.id, sort_by_parameter_order=True),
+                    [values for _, values in to_insert]
+                ).all()
+                
+                deltas = {}
+                for _, values in to_insert:
+                    deltas[values['customer_id']] = deltas.get(values['customer_id'], 0) + CustomerTransaction.balance_effect('payment', values['amount'])
+                Customer.adjust_balances(deltas)
+                allocate_payments(deltas.keys())
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error posting payment batch starting at row {batch[0][0] + 1}: {str(e)}")
+            for index, _ in batch:
+                results[index] = {'row': index + 1, 'status': 'error', 'error': str(e)}
+            continue
+        
+        for (index, values), transaction_id in zip(to_insert, transaction_ids):
+            results[index] = {
+                'row': index + 1,
+                'status': 'posted',
+                'customer_id': values['customer_id'],
+                'transaction_id': transaction_id
+            }
+    
+    return results
+
+def _payment_summary(results):
+    return {
+        'success': True,
+        'posted_count': sum(1 for result in results if result['status'] == 'posted'),
+        'duplicate_count': sum(1 for result in results if result['status'] == 'duplicate'),
+        'error_count': sum(1 for result in results if result['status'] == 'error'),
+        'results': results
+    }
+
+@bp.route('/customers/payments/bulk', methods=['POST'])
+@login_required
+@permission_required('edit_customers')
+def bulk_customer_payments():
+    data = request.json or {}
+    payments = data.get('payments')
+    if not isinstance(payments, list) or not payments:
+        return jsonify({'success': False, 'error': 'payments must be a non-empty list'}), 400
+    return jsonify(_payment_summary(post_payments(payments)))
+
+@bp.route('/customers/payments/import', methods=['POST'])
+@login_required
+@permission_required('edit_customers')
+def import_customer_payments():
+    """Post payments from an Excel/CSV sheet.
+    
+    Expected columns (header names, case-insensitive): Customer ID or Phone,
+    Amount, and optionally Payment Method, Reference Number, Notes and Date.
+    """
+    import pandas as pd
+    
+    if 'file' not in request.files:
+        return jsonify({'success': False, 'error': 'No file uploaded'}), 400
+    
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({'success': False, 'error': 'No file selected'}), 400
+    
+    try:
+        if file.filename.lower().endswith('.csv'):
+            df = pd.read_csv(file, dtype=str, keep_default_na=False)
+        elif file.filename.lower().endswith(('.xlsx', '.xls')):
+            df = pd.read_excel(file)
+        else:
+            return jsonify({'success': False, 'error': 'Invalid file format. Please upload an Excel or CSV file.'}), 400
+    except Exception as e:
+        print(f"Error reading payment file: {str(e)}")
+        return jsonify({'success': False, 'error': f'Error reading file: {str(e)}'}), 400
+    
+    df.columns = [str(column).strip().lower().replace(' ', '_') for column in df.columns]
+    if 'amount' not in df.columns or not ({'customer_id', 'phone'} & set(df.columns)):
+        return jsonify({'success': False, 'error': 'The sheet needs an Amount column and a Customer ID or Phone column'}), 400
+    
+    rows = df.to_dict('records')
+    print(f"Importing {len(rows)} payments from {file.filename}")
+    results = post_payments(rows)
+    # Report spreadsheet row numbers (row 1 is the header)
+    for result in results:
+        result['row'] += 1
+    return jsonify(_payment_summary(results))
+
+@bp.route('/customers/<int:id>/link-invoice', methods=['POST'])
+@login_required
+def link_invoice_to_customer(id):
+    try:
+        data = request.json
+        invoice_id = data.get('invoice_id')
+        additional_amount = float(data.get('additional_amount', 0))
+        notes = data.get('notes', '')
+        
+        # Get the invoice and customer
+        invoice = Invoice.query.get_or_404(invoice_id)
+        customer = Customer.query.get_or_404(id)
+        
+        # Link the invoice to the customer
+        invoice.customer_id = id
+        invoice.customer_name = customer.name
+        
+        # Create a receivable record
+        receivable = CustomerReceivable(
+            customer_id=id,
+            amount=invoice.total_amount,
+            notes=notes,
+            invoice_id=invoice_id,
+            additional_amount=additional_amount
+        )
+        
+        db.session.add(receivable)
+        
+        # Update customer balance
+        Customer.adjust_balance(id, receivable.amount + receivable.additional_amount)
+        allocate_payments([id])
+        
+        db.session.commit()
+        remember_customer(customer)
+        return jsonify({'success': True})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
+@bp.route('/customers/<int:id>/receivable', methods=['POST'])
+@login_required
+def add_customer_receivable(id):
+    try:
+        data = request.json
+        amount = float(data.get('amount'))
+        notes = data.get('notes')
+        
+        if not amount or not notes:
+            return jsonify({'success': False, 'error': 'Amount and notes are required'})
+        
+        customer = Customer.query.get_or_404(id)
+        
+        receivable = CustomerReceivable(
+            customer_id=id,
+            amount=amount,
+            notes=notes
+        )
+        
+        db.session.add(receivable)
+        Customer.adjust_balance(id, amount)
+        allocate_payments([id])
+        db.session.commit()
+        
+        return jsonify({'success': True})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
+@bp.route('/customers/transaction/<int:id>', methods=['PUT', 'DELETE'])
+@login_required
+def manage_transaction(id):
+    transaction = CustomerTransaction.query.get_or_404(id)
+    
+    if request.method == 'PUT':
+        data = request.json
+        try:
+            old_effect = CustomerTransaction.balance_effect(transaction.transaction_type, transaction.amount)
+            transaction.amount = float(data['amount'])
+            transaction.payment_method = data['payment_method']
+            transaction.reference_number = data.get('reference_number')
+            transaction.notes = data.get('notes')
+            
+            # Update customer balance by the change in this transaction's effect
+            Customer.adjust_balance(
+                transaction.customer_id,
+                CustomerTransaction.balance_effect(transaction.transaction_type, transaction.amount) - old_effect
+            )
+            
+            # Re-apply this customer's payments to their invoices
+            allocate_payments([transaction.customer_id])
+            
+            db.session.commit()
+            return jsonify({'success': True})
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': str(e)})
+    
+    elif request.method == 'DELETE':
+        try:
+            customer = transaction.customer
+            db.session.delete(transaction)
+            
+            # Reverse this transaction's effect on the balance
+            Customer.adjust_balance(
+                customer.id,
+                -CustomerTransaction.balance_effect(transaction.transaction_type, transaction.amount)
+            )
+            
+            # Re-apply the remaining payments to the customer's invoices
+            allocate_payments([customer.id])
+            
+            db.session.commit()
+            return jsonify({'success': True})
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': str(e)})
+
+def _fifo_allocation(customer_ids=None):
+    """Subquery applying each customer's net payments (payments minus refunds) to
+    their receivables oldest-first.
+    
+    One row per receivable with its total and the amount allocated to it; a
+    window function gives the amount owed on earlier receivables, so the
+    allocation is set-wise with no per-customer loop. None means all customers.
+    """
+    paid = db.session.query(
+        CustomerTransaction.customer_id,
+        func.sum(db.case(
+            (CustomerTransaction.transaction_type == 'payment', CustomerTransaction.amount),
+            (CustomerTransaction.transaction_type == 'refund', -CustomerTransaction.amount),
+            else_=0
+        )).label('paid')
+    )
+    if customer_ids is not None:
+        paid = paid.filter(CustomerTransaction.customer_id.in_(customer_ids))
+    paid = paid.group_by(CustomerTransaction.customer_id).subquery()
+    
+    total = CustomerReceivable.amount + func.coalesce(CustomerReceivable.additional_amount, 0)
+    ordered = db.session.query(
+        CustomerReceivable.id,
+        CustomerReceivable.customer_id,
+        CustomerReceivable.invoice_id,
+        CustomerReceivable.date,
+        total.label('total'),
+        # Everything owed on this customer's earlier receivables
+        (func.sum(total).over(
+            partition_by=CustomerReceivable.customer_id,
+            order_by=(CustomerReceivable.date, CustomerReceivable.id)
+        ) - total).label('owed_before')
+    )
+    if customer_ids is not None:
+        ordered = ordered.filter(CustomerReceivable.customer_id.in_(customer_ids))
+    ordered = ordered.subquery()
+    
+    available = func.coalesce(paid.c.paid, 0) - ordered.c.owed_before
+    return db.session.query(
+        ordered.c.id,
+        ordered.c.customer_id,
+        ordered.c.invoice_id,
+        ordered.c.date,
+        ordered.c.total,
+        db.case(
+            (available <= 0, 0),
+            (available >= ordered.c.total, ordered.c.total),
+            else_=available
+        ).label('allocated')
+    ).outerjoin(paid, paid.c.customer_id == ordered.c.customer_id).subquery()
+
+def allocate_payments(customer_ids):
+    """Apply each customer's net payments to their receivables oldest-first and
+    store the allocation on receivables and linked invoices.
+    
+    The allocation is one windowed query; receivables and invoices (including
+    payment_status) are each refreshed with a single UPDATE ... FROM.
+    """
+    customer_ids = list(set(customer_ids))
+    if not customer_ids:
+        return
+    
+    allocation = _fifo_allocation(customer_ids)
+    
+    db.session.execute(
+        db.update(CustomerReceivable)
+        .where(CustomerReceivable.id == allocation.c.id)
+        .values(paid_amount=allocation.c.allocated)
+        .execution_options(synchronize_session=False)
+    )
+    
+    per_invoice = db.session.query(
+        allocation.c.invoice_id,
+        func.sum(allocation.c.total).label('total'),
+        func.sum(allocation.c.allocated).label('paid')
+    ).filter(allocation.c.invoice_id.isnot(None)).group_by(allocation.c.invoice_id).subquery()
+    
+    db.session.execute(
+        db.update(Invoice)
+        .where(Invoice.id == per_invoice.c.invoice_id)
+        .values(
+            paid_amount=per_invoice.c.paid,
+            payment_status=db.case(
+                (per_invoice.c.paid >= per_invoice.c.total - 0.005, 'paid'),
+                (per_invoice.c.paid > 0, 'partial'),
+                else_='pending'
+            )
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+AGING_BUCKETS = (('0_30', 0, 30), ('31_60', 31, 60), ('61_90', 61, 90), ('90_plus', 91, None))
+
+def aged_receivables(as_of=None):
+    """Outstanding receivables per customer split into age buckets, in one query.
+    
+    Payments are applied FIFO (see _fifo_allocation), so what remains open is
+    always the newest part of a customer's debt. Age is counted in days from
+    the receivable date to as_of.
+    """
+    as_of = as_of or date.today()
+    allocation = _fifo_allocation()
+    outstanding = allocation.c.total - allocation.c.allocated
+    
+    bucket_columns = []
+    for name, min_days, max_days in AGING_BUCKETS:
+        # Receivable dates are datetimes: age N days means the date falls on as_of - N
+        conditions = []
+        if min_days > 0:
+            conditions.append(allocation.c.date < datetime.combine(as_of - timedelta(days=min_days - 1), datetime.min.time()))
+        if max_days is not None:
+            conditions.append(allocation.c.date >= datetime.combine(as_of - timedelta(days=max_days), datetime.min.time()))
+        condition = db.and_(*conditions)
+        bucket_columns.append(func.sum(db.case((condition, outstanding), else_=0)).label(name))
+    
+    rows = db.session.query(
+        Customer.id,
+        Customer.name,
+        Customer.phone,
+        *bucket_columns,
+        func.sum(outstanding).label('total'),
+        func.min(db.case((outstanding > 0.005, allocation.c.date))).label('oldest_open')
+    ).join(allocation, allocation.c.customer_id == Customer.id).group_by(
+        Customer.id, Customer.name, Customer.phone
+    ).having(func.sum(outstanding) > 0.005).order_by(func.sum(outstanding).desc()).all()
+    
+    customers = [{
+        'customer_id': row.id,
+        'name': row.name,
+        'phone': row.phone,
+        **{name: round(getattr(row, name) or 0, 2) for name, _, _ in AGING_BUCKETS},
+        'total': round(row.total or 0, 2),
+        'oldest_open': row.oldest_open.strftime('%Y-%m-%d') if row.oldest_open else None
+    } for row in rows]
+    
+    return {
+        'as_of': as_of.isoformat(),
+        'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M'),
+        'customers': customers,
+        'totals': {
+            name: round(sum(customer[name] for customer in customers), 2)
+            for name in [bucket[0] for bucket in AGING_BUCKETS] + ['total']
+        }
+    }
+
+@bp.route('/reports/aged-receivables')
+@login_required
+@permission_required('view_reports')
+def aged_receivables_report():
+    """Aged receivables, computed once per day and served from cache (?refresh=1 recomputes)"""
+    cache_key = f'aged_receivables_{date.today().isoformat()}'
+    report = None if request.args.get('refresh') else cache.get(cache_key)
+    if report is None:
+        report = aged_receivables()
+        cache.set(cache_key, report, timeout=86400)
+    
+    if request.args.get('format') == 'json':
+        return jsonify({'success': True, **report})
+    return render_template('aged_receivables.html', report=report, buckets=AGING_BUCKETS)
+
+@bp.cli.command('allocate-payments')
+def allocate_payments_command():
+    """Recompute FIFO payment allocation and invoice payment status for all customers"""
+    customer_ids = [row.id for row in db.session.query(Customer.id)]
+    allocate_payments(customer_ids)
+    db.session.commit()
+    print(f"Allocated payments for {len(customer_ids)} customers")
+
+@bp.route('/customers/receivable/<int:id>', methods=['PUT', 'DELETE'])
+@login_required
+def manage_receivable(id):
+    receivable = CustomerReceivable.query.get_or_404(id)
+    
+    if request.method == 'PUT':
+        data = request.json
+        try:
+            old_total = receivable.amount + (receivable.additional_amount or 0)
+            receivable.amount = float(data['amount'])
+            receivable.additional_amount = float(data.get('additional_amount', 0))
+            receivable.notes = data['notes']
+            
+            # Update customer balance by the change in the receivable
+            Customer.adjust_balance(
+                receivable.customer_id,
+                receivable.amount + receivable.additional_amount - old_total
+            )
+            
+            # Re-apply payments, since later receivables shift when this one changes
+            allocate_payments([receivable.customer_id])
+            
+            db.session.commit()
+            return jsonify({'success': True})
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': str(e)})
+    
+    elif request.method == 'DELETE':
+        try:
+            # Store reference to customer and invoice before deleting
+            customer = receivable.customer
+            invoice = receivable.invoice
+            
+            # If this receivable is linked to an invoice, unlink it
+            if invoice:
+                invoice.customer_id = None
+                invoice.customer_name = None
+                invoice.payment_status = 'pending'
+                invoice.paid_amount = 0.0
+            
+            # Delete the receivable
+            db.session.delete(receivable)
+            
+            # Update customer balance
+            Customer.adjust_balance(customer.id, -(receivable.amount + (receivable.additional_amount or 0)))
+            allocate_payments([customer.id])
+            
+            db.session.commit()
+            return jsonify({'success': True})
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': str(e)})
+
+def reconcile_customer_balances(fix=False):
+    """Recompute every customer's balance from the ledger in one grouped query and report drift.
+    
+    Stored balances are maintained incrementally; this catches anything that
+    changed the ledger without going through Customer.adjust_balance.
+    """
+    receivables = db.session.query(
+        CustomerReceivable.customer_id,
+        func.sum(CustomerReceivable.amount + func.coalesce(CustomerReceivable.additional_amount, 0)).label('total')
+    ).group_by(CustomerReceivable.customer_id).subquery()
+    
+    transactions = db.session.query(
+        CustomerTransaction.customer_id,
+        func.sum(db.case(
+            (CustomerTransaction.transaction_type == 'payment', -CustomerTransaction.amount),
+            (CustomerTransaction.transaction_type == 'refund', CustomerTransaction.amount),
+            else_=0
+        )).label('total')
+    ).group_by(CustomerTransaction.customer_id).subquery()
+    
+    rows = db.session.query(
+        Customer.id,
+        Customer.name,
+        Customer.balance,
+        (func.coalesce(receivables.c.total, 0) + func.coalesce(transactions.c.total, 0)).label('expected')
+    ).outerjoin(receivables, receivables.c.customer_id == Customer.id).outerjoin(
+        transactions, transactions.c.customer_id == Customer.id
+    ).all()
+    
+    drift = [{
+        'customer_id': row.id,
+        'name': row.name,
+        'balance': row.balance or 0,
+        'expected': round(row.expected, 2),
+        'difference': round((row.balance or 0) - row.expected, 2)
+    } for row in rows if abs((row.balance or 0) - row.expected) >= 0.005]
+    
+    if fix and drift:
+        # Remove the drift as a delta, so ledger changes committed since the read aren't overwritten
+        Customer.adjust_balances({entry['customer_id']: -entry['difference'] for entry in drift})
+        db.session.commit()
+    
+    return {'checked': len(rows), 'drift': drift, 'fixed': fix}
+
+@bp.route('/settings/reconcile-balances', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def reconcile_balances():
+    # GET reports drift; POST also corrects it
+    try:
+        return jsonify({'success': True, **reconcile_customer_balances(fix=request.method == 'POST')})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@bp.cli.command('reconcile-balances')
+@click.option('--fix', is_flag=True, help='Correct drifted balances instead of only reporting them')
+def reconcile_balances_command(fix):
+    """Check stored customer balances against the ledger (run periodically, e.g. from cron)"""
+    result = reconcile_customer_balances(fix=fix)
+    print(f"Checked {result['checked']} customers, {len(result['drift'])} with drift")
+    for entry in result['drift']:
+        print(f"- {entry['customer_id']} {entry['name']}: stored {entry['balance']}, ledger {entry['expected']}")
+    if fix and result['drift']:
+        print("Drifted balances corrected")
@@ -0,0 +1,600 @@
+"""Invoices: creation, offline sync, editing and printing"""
+from flask import Blueprint, render_template, request, redirect, url_for, jsonify, send_file, make_response, abort, current_app
+from datetime import datetime
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from io import BytesIO
+import os
+import hashlib
+import orjson
+from extensions import db, cache
+from models import Product, Customer, CustomerReceivable, Invoice, InvoiceItem
+from auth import login_required, permission_required
+from stock import STOCK_OVERSELL_POLICY, InsufficientStockError, _apply_stock_deltas, _stock_error_response, _stock_warnings
+from blueprints.settings import render_print_template
+from blueprints.customers import allocate_payments, remember_customer
+
+bp = Blueprint('invoices', __name__, cli_group=None)
+
+def _sync_invoice_items(invoice, items_data):
+    """Diff incoming lines against the invoice's items and write only the changes.
+    
+    Lines are matched on InvoiceItem id, falling back to product for clients that
+    don't send ids. Stock moves by the net difference per product; returns the
+    ids of products that were oversold.
+    """
+    unmatched = {item.id: item for item in invoice.items}
+    by_product = {}
+    for item in invoice.items:
+        by_product.setdefault(item.product_id, []).append(item)
+    
+    deltas = {}
+    for item_data in items_data:
+        product_id = int(item_data['product_id'])
+        quantity = item_data['quantity']
+        
+        item = unmatched.pop(item_data.get('id'), None)
+        if item is None:
+            for candidate in by_product.get(product_id, []):
+                if candidate.id in unmatched:
+                    item = unmatched.pop(candidate.id)
+                    break
+        
+        if item is None:
+            invoice.items.append(InvoiceItem(
+                product_id=product_id,
+                quantity=quantity,
+                price=item_data['price'],
+                amount=item_data['amount']
+            ))
+            deltas[product_id] = deltas.get(product_id, 0) - quantity
+            continue
+        
+        if item.product_id != product_id or item.quantity != quantity:
+            deltas[item.product_id] = deltas.get(item.product_id, 0) + item.quantity
+            deltas[product_id] = deltas.get(product_id, 0) - quantity
+            item.product_id = product_id
+            item.quantity = quantity
+        if item.price != item_data['price']:
+            item.price = item_data['price']
+        if item.amount != item_data['amount']:
+            item.amount = item_data['amount']
+    
+    # Whatever wasn't matched was removed from the invoice
+    for item in unmatched.values():
+        deltas[item.product_id] = deltas.get(item.product_id, 0) + item.quantity
+        invoice.items.remove(item)
+    
+    return _apply_stock_deltas(deltas, 'invoice_edit', invoice.id)
+
+@bp.route('/invoices')
+@login_required
+@permission_required('view_invoices')
+def invoices():
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    
+    query = Invoice.query
+    if start_date and end_date:
+        query = query.filter(
+            Invoice.date >= datetime.strptime(start_date, '%Y-%m-%d').date(),
+            Invoice.date <= datetime.strptime(end_date, '%Y-%m-%d').date()
+        )
+    
+    invoices = query.order_by(Invoice.date.desc()).all()
+    return render_template('invoices.html', invoices=invoices)
+
+def _invoice_detail_response(id):
+    """Invoice with its lines from one joined query, with an ETag for cheap revalidation"""
+    rows = db.session.query(
+        Invoice.id, Invoice.order_number, Invoice.date, Invoice.customer_name,
+        Invoice.total_amount, Invoice.total_items,
+        InvoiceItem.id.label('item_id'), InvoiceItem.product_id, Product.item_code,
+        Product.description, Product.uom, InvoiceItem.quantity, InvoiceItem.price, InvoiceItem.amount
+    ).outerjoin(InvoiceItem, InvoiceItem.invoice_id == Invoice.id).outerjoin(
+        Product, Product.id == InvoiceItem.product_id
+    ).filter(Invoice.id == id).order_by(InvoiceItem.id).all()
+    
+    if not rows:
+        abort(404)
+    
+    # The ETag is derived from the rows themselves, so any change to the invoice,
+    # its lines or the products they show produces a new one
+    etag = hashlib.sha1(repr([tuple(row) for row in rows]).encode('utf-8')).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+        response.set_etag(etag)
+        return response
+    
+    head = rows[0]
+    response = make_response(orjson.dumps({
+        'id': head.id,
+        'order_number': head.order_number,
+        'date': head.date.isoformat(),
+        'customer_name': head.customer_name,
+        'total_amount': head.total_amount,
+        'total_items': head.total_items,
+        'items': [{
+            'id': row.item_id,
+            'product_id': row.product_id,
+            'product_code': row.item_code,
+            'description': row.description,
+            'uom': row.uom,
+            'quantity': row.quantity,
+            'price': row.price,
+            'amount': row.amount
+        } for row in rows if row.item_id is not None]
+    }))
+    response.mimetype = 'application/json'
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@bp.route('/invoices/<int:id>', methods=['GET', 'PUT', 'DELETE'])
+def invoice(id):
+    if request.method == 'GET':
+        return _invoice_detail_response(id)
+    
+    invoice = Invoice.query.get_or_404(id)
+    
+    if request.method == 'PUT':
+        data = request.json
+        invoice.date = datetime.strptime(data['date'], '%Y-%m-%d').date()
+        invoice.customer_name = data['customer_name']
+        invoice.total_amount = float(data['total_amount'])
+        invoice.total_items = int(data['total_items'])
+        
+        try:
+            # Only insert/update/delete the lines that changed
+            oversold = _sync_invoice_items(invoice, data['items'])
+            db.session.commit()
+            # Return the invoice ID so the frontend can handle printing
+            return jsonify({
+                'success': True,
+                'id': invoice.id,
+                'redirect': url_for('invoices.new_invoice'),
+                'stock_warnings': _stock_warnings(oversold)
+            })
+        except InsufficientStockError as e:
+            db.session.rollback()
+            return _stock_error_response(e)
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': str(e)})
+    
+    elif request.method == 'DELETE':
+        data = request.json
+        restore_stock = data.get('restore_stock', False)
+        
+        try:
+            if restore_stock:
+                # Restore stock for all items
+                returned = {}
+                for item in invoice.items:
+                    returned[item.product_id] = returned.get(item.product_id, 0) + item.quantity
+                _apply_stock_deltas(returned, 'invoice_delete', invoice.id)
+            
+            db.session.delete(invoice)
+            db.session.commit()
+            return jsonify({'success': True})
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': str(e)})
+
+@bp.route('/invoices/<int:id>/print')
+def print_invoice(id):
+    invoice = Invoice.query.get_or_404(id)
+    return render_print_template('invoice', request.args.get('template_id', type=int), invoice=invoice)
+
+@bp.route('/invoices/<int:id>/print-tamil')
+def print_invoice_tamil(id):
+    invoice = Invoice.query.get_or_404(id)
+    return render_template('print_invoice_tamil.html', invoice=invoice)
+
+def _invoice_print_payloads(*criteria):
+    """Load invoices matching criteria as plain dicts for the PDF renderer (two queries total)"""
+    headers = db.session.query(
+        Invoice.id, Invoice.order_number, Invoice.date, Invoice.customer_name, Invoice.total_amount
+    ).filter(*criteria).order_by(Invoice.date, Invoice.id).all()
+    
+    payloads = {}
+    for header in headers:
+        payloads[header.id] = {
+            'id': header.id,
+            'order_number': header.order_number,
+            'date': header.date,
+            'customer_name': header.customer_name,
+            'total_amount': header.total_amount,
+            'items': []
+        }
+    
+    if payloads:
+        lines = db.session.query(
+            InvoiceItem.invoice_id, Product.description, Product.tamil_name, Product.uom,
+            InvoiceItem.quantity, InvoiceItem.price, InvoiceItem.amount
+        ).join(Product, InvoiceItem.product_id == Product.id).join(
+            Invoice, InvoiceItem.invoice_id == Invoice.id
+        ).filter(*criteria).order_by(InvoiceItem.id).all()
+        
+        for line in lines:
+            payloads[line.invoice_id]['items'].append({
+                'description': line.description,
+                'tamil_name': line.tamil_name,
+                'uom': line.uom,
+                'quantity': line.quantity,
+                'price': line.price,
+                'amount': line.amount
+            })
+    
+    return list(payloads.values())
+
+def _pdf_font_error(error):
+    print(f"PDF rendering failed: {str(error)}")
+    return jsonify({'success': False, 'error': str(error)}), 503
+
+def _invoice_pdf_response(id, lang):
+    from invoice_pdf import FontNotFoundError, payload_version, render_invoice_pdf
+    
+    payloads = _invoice_print_payloads(Invoice.id == id)
+    if not payloads:
+        abort(404)
+    payload = payloads[0]
+    
+    # Cache per invoice and language; a content change produces a new version and a re-render
+    version = payload_version(payload)
+    cache_key = f'invoice_pdf_{id}_{lang}'
+    cached = cache.get(cache_key)
+    if cached and cached['version'] == version:
+        pdf = cached['pdf']
+    else:
+        try:
+            pdf = render_invoice_pdf(payload, lang)
+        except FontNotFoundError as e:
+            return _pdf_font_error(e)
+        cache.set(cache_key, {'version': version, 'pdf': pdf}, timeout=86400)
+    
+    return send_file(
+        BytesIO(pdf),
+        mimetype='application/pdf',
+        download_name=f"invoice_{payload['order_number']}_{payload['date'].isoformat()}.pdf",
+        etag=version
+    )
+
+@bp.route('/invoices/<int:id>/pdf')
+@login_required
+def invoice_pdf(id):
+    return _invoice_pdf_response(id, 'en')
+
+@bp.route('/invoices/<int:id>/pdf-tamil')
+@login_required
+def invoice_pdf_tamil(id):
+    return _invoice_pdf_response(id, 'ta')
+
+@bp.route('/new_invoice', methods=['GET', 'POST'])
+def new_invoice():
+    if request.method == 'POST':
+        data = request.json
+        # The page sends a client_key so a retried or later-synced copy of this invoice isn't saved twice
+        client_key = str(data.get('client_key') or '') or None
+        if client_key and len(client_key) > 64:
+            return jsonify({'success': False, 'error': 'Invalid client_key'}), 400
+        if client_key:
+            existing = Invoice.query.filter_by(client_key=client_key).first()
+            if existing:
+                return _duplicate_invoice_response(existing)
+        
+        invoice = Invoice(
+            order_number=Invoice.generate_order_number(),
+            date=datetime.strptime(data['date'], '%Y-%m-%d').date(),
+            customer_id=data.get('customer_id'),
+            customer_name=data['customer_name'],
+            total_amount=float(data['total_amount']),
+            total_items=int(data['total_items']),
+            client_key=client_key
+        )
+        
+        try:
+            db.session.add(invoice)
+            
+            sold = {}
+            for item_data in data['items']:
+                invoice_item = InvoiceItem(
+                    invoice=invoice,
+                    product_id=item_data['product_id'],
+                    quantity=item_data['quantity'],
+                    price=item_data['price'],
+                    amount=item_data['amount']
+                )
+                product_id = int(item_data['product_id'])
+                sold[product_id] = sold.get(product_id, 0) - item_data['quantity']
+                db.session.add(invoice_item)
+            
+            db.session.flush()
+            oversold = _apply_stock_deltas(sold, 'sale', invoice.id)
+            
+            # The balance only changes once the invoice is linked as a receivable
+            db.session.commit()
+            # Change the response to include redirect URL
+            return jsonify({
+                'success': True, 
+                'id': invoice.id,
+                'redirect': url_for('invoices.new_invoice'),
+                'stock_warnings': _stock_warnings(oversold)
+            })
+        except InsufficientStockError as e:
+            db.session.rollback()
+            return _stock_error_response(e)
+        except IntegrityError:
+            db.session.rollback()
+            existing = Invoice.query.filter_by(client_key=client_key).first() if client_key else None
+            if existing:
+                # A concurrent request (or the sync of a queued copy) saved it first
+                return _duplicate_invoice_response(existing)
+            return jsonify({'success': False, 'error': 'Invoice could not be saved, please retry'})
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': str(e)})
+    
+    customer_id = request.args.get('customer_id')
+    customer = Customer.query.get(customer_id) if customer_id else None
+    # Products are loaded client-side from /products/catalog rather than rendered into the page
+    return render_template('new_invoice.html', customer=customer)
+
+def _duplicate_invoice_response(invoice):
+    """Response for a new invoice whose client_key was already saved"""
+    return jsonify({
+        'success': True,
+        'duplicate': True,
+        'id': invoice.id,
+        'customer_id': invoice.customer_id,  # Set once linked, so the page doesn't link it again
+        'redirect': url_for('invoices.new_invoice'),
+        'stock_warnings': []
+    })
+
+def _next_order_numbers(dates):
+    """Latest order number per invoice date, so a batch can allocate numbers in memory"""
+    next_numbers = {}
+    for invoice_date in dates:
+        latest_invoice = Invoice.query.filter(
+            func.date(Invoice.date) == invoice_date
+        ).order_by(Invoice.id.desc()).first()
+        next_numbers[invoice_date] = int(latest_invoice.order_number) if latest_invoice else 0
+    return next_numbers
+
+@bp.route('/invoices/sync', methods=['POST'])
+@login_required
+@permission_required('create_invoices')
+def sync_invoices():
+    """Save a batch of invoices captured offline in one transaction.
+    
+    Each invoice carries a client-generated client_key; invoices whose key was
+    already synced are reported as duplicates instead of being saved twice.
+    Invoices with a customer_id are linked to the customer with a receivable,
+    as link-invoice does for invoices saved online.
+    """
+    data = request.get_json(silent=True)
+    batch = data.get('invoices', []) if isinstance(data, dict) else None
+    if not isinstance(batch, list):
+        return jsonify({'success': False, 'error': 'Expected a JSON object with an invoices list'}), 400
+    
+    results = []
+    valid = []
+    for invoice_data in batch:
+        client_key = None
+        try:
+            if not isinstance(invoice_data, dict):
+                raise TypeError('invoice must be an object')
+            client_key = str(invoice_data.get('client_key') or '')
+            if not client_key or len(client_key) > 64:
+                results.append({'client_key': client_key, 'status': 'error', 'error': 'Invalid client_key'})
+                continue
+            invoice_data['client_key'] = client_key
+            invoice_data['date'] = datetime.strptime(invoice_data['date'], '%Y-%m-%d').date()
+            invoice_data['total_amount'] = float(invoice_data['total_amount'])
+            invoice_data['total_items'] = int(invoice_data['total_items'])
+            customer_id = invoice_data.get('customer_id')
+            invoice_data['customer_id'] = int(customer_id) if customer_id not in (None, '') else None
+            for item_data in invoice_data['items']:
+                item_data['product_id'] = int(item_data['product_id'])
+                quantity = float(item_data['quantity'])
+                if not quantity.is_integer():
+                    raise ValueError(f"quantity must be a whole number, got {item_data['quantity']}")
+                item_data['quantity'] = int(quantity)
+                item_data['price'] = float(item_data['price'])
+                item_data['amount'] = float(item_data['amount'])
+        except (KeyError, TypeError, ValueError, OverflowError) as e:
+            results.append({'client_key': client_key, 'status': 'error', 'error': f'Invalid invoice data: {str(e)}'})
+            continue
+        valid.append(invoice_data)
+    
+    keys = [invoice_data['client_key'] for invoice_data in valid]
+    product_ids = {item_data['product_id'] for invoice_data in valid for item_data in invoice_data['items']}
+    customer_ids = {invoice_data['customer_id'] for invoice_data in valid if invoice_data['customer_id']}
+    
+    created = []
+    try:
+        synced = dict(db.session.query(Invoice.client_key, Invoice.id).filter(Invoice.client_key.in_(keys)).all()) if keys else {}
+        known_products = {row.id for row in db.session.query(Product.id).filter(Product.id.in_(product_ids))} if product_ids else set()
+        customers = {customer.id: customer for customer in Customer.query.filter(Customer.id.in_(customer_ids))} if customer_ids else {}
+        next_numbers = _next_order_numbers({invoice_data['date'] for invoice_data in valid})
+        
+        deltas = {}
+        for invoice_data in valid:
+            client_key = invoice_data['client_key']
+            if client_key in synced:
+                results.append({'client_key': client_key, 'status': 'duplicate', 'id': synced[client_key]})
+                continue
+            
+            missing = [item_data['product_id'] for item_data in invoice_data['items'] if item_data['product_id'] not in known_products]
+            if missing:
+                results.append({'client_key': client_key, 'status': 'error', 'error': f'Unknown products: {missing}'})
+                continue
+            
+            customer = customers.get(invoice_data['customer_id'])
+            if invoice_data['customer_id'] and customer is None:
+                results.append({'client_key': client_key, 'status': 'error', 'error': f"Unknown customer: {invoice_data['customer_id']}"})
+                continue
+            
+            next_numbers[invoice_data['date']] += 1
+            invoice = Invoice(
+                order_number=str(next_numbers[invoice_data['date']]).zfill(3),
+                date=invoice_data['date'],
+                customer_id=customer.id if customer else None,
+                customer_name=customer.name if customer else invoice_data.get('customer_name'),
+                total_amount=invoice_data['total_amount'],
+                total_items=invoice_data['total_items'],
+                client_key=client_key
+            )
+            for item_data in invoice_data['items']:
+                invoice.items.append(InvoiceItem(
+                    product_id=item_data['product_id'],
+                    quantity=item_data['quantity'],
+                    price=item_data['price'],
+                    amount=item_data['amount']
+                ))
+                deltas[item_data['product_id']] = deltas.get(item_data['product_id'], 0) - item_data['quantity']
+            
+            db.session.add(invoice)
+            synced[client_key] = None  # Repeated keys within the batch are duplicates too
+            created.append(invoice)
+        
+        # One stock UPDATE for the batch, with the movements recorded per invoice
+        db.session.flush()
+        movements = {}
+        for invoice in created:
+            sold = movements.setdefault(invoice.id, {})
+            for item in invoice.items:
+                sold[item.product_id] = sold.get(item.product_id, 0) - item.quantity
+        # These sales already happened offline, so they are never rejected for stock
+        _apply_stock_deltas(deltas, 'sale', movements=movements, policy='warn' if STOCK_OVERSELL_POLICY == 'reject' else None)
+        
+        # Receivables per linked invoice and one balance UPDATE for the batch
+        balance_deltas = {}
+        for invoice in created:
+            if invoice.customer_id:
+                db.session.add(CustomerReceivable(
+                    customer_id=invoice.customer_id,
+                    amount=invoice.total_amount,
+                    notes='',
+                    invoice_id=invoice.id
+                ))
+                balance_deltas[invoice.customer_id] = balance_deltas.get(invoice.customer_id, 0) + invoice.total_amount
+        db.session.flush()
+        Customer.adjust_balances(balance_deltas)
+        allocate_payments(balance_deltas.keys())
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        new_keys = [invoice.client_key for invoice in created]
+        if new_keys and db.session.query(Invoice.id).filter(Invoice.client_key.in_(new_keys)).first():
+            # Another request synced one of these keys first; the client can safely retry
+            return jsonify({'success': False, 'error': 'Batch conflicted with a concurrent sync, please retry'}), 409
+        print(f"Invoice sync failed: {str(e)}")
+        return jsonify({'success': False, 'error': 'Batch could not be saved'}), 500
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+    
+    for customer_id in balance_deltas:
+        remember_customer(customers[customer_id])
+    
+    created_by_key = {invoice.client_key: invoice for invoice in created}
+    for result in results:
+        if result['status'] == 'duplicate' and result['id'] is None:
+            result['id'] = created_by_key[result['client_key']].id
+    results.extend({
+        'client_key': invoice.client_key,
+        'status': 'created',
+        'id': invoice.id,
+        'order_number': invoice.order_number
+    } for invoice in created)
+    
+    return jsonify({'success': True, 'results': results})
+
+@bp.route('/invoices/print_summary')
+@login_required
+def print_summary():
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    
+    query = Invoice.query
+    
+    if start_date:
+        start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
+        query = query.filter(Invoice.date >= start_date)
+    if end_date:
+        end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
+        query = query.filter(Invoice.date <= end_date)
+    
+    invoices = query.order_by(Invoice.date).all()
+    total_amount = sum(invoice.total_amount for invoice in invoices)
+    
+    return render_print_template('summary',
+                                 request.args.get('template_id', type=int),
+                                 invoices=invoices,
+                                 total_amount=total_amount)
+
+@bp.route('/invoices/print_batch_pdf')
+@login_required
+@permission_required('view_invoices')
+def print_batch_pdf():
+    from invoice_pdf import FontNotFoundError, render_batch_pdf
+    
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    lang = 'ta' if request.args.get('lang') == 'ta' else 'en'
+    
+    criteria = []
+    try:
+        if start_date:
+            criteria.append(Invoice.date >= datetime.strptime(start_date, '%Y-%m-%d').date())
+        if end_date:
+            criteria.append(Invoice.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Dates must be in YYYY-MM-DD format'}), 400
+    
+    payloads = _invoice_print_payloads(*criteria)
+    if not payloads:
+        return jsonify({'success': False, 'error': 'No invoices found for the selected dates'}), 404
+    
+    try:
+        pdf = render_batch_pdf(payloads, lang, processes=current_app.config['PDF_BATCH_PROCESSES'])
+    except FontNotFoundError as e:
+        return _pdf_font_error(e)
+    return send_file(
+        BytesIO(pdf),
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=f"invoices_{start_date or 'all'}_{end_date or 'all'}.pdf"
+    )
+
+@bp.route('/invoices/list')
+def list_invoices():
+    invoices = Invoice.query.order_by(Invoice.date.desc()).all()
+    return jsonify({
+        'invoices': [
+            {
+                'id': invoice.id,
+                'order_number': invoice.order_number,
+                'date': invoice.date.isoformat(),
+                'customer_name': invoice.customer_name,
+                'total_amount': invoice.total_amount
+            } for invoice in invoices
+        ]
+    })
+
+@bp.route('/save_invoice', methods=['POST'])
+def save_invoice():
+    # ... existing invoice saving code ...
+    
+    # Change the redirect from /invoices to /new_invoice
+    return redirect(url_for('invoices.new_invoice'))
+
+# Add this function for database connection
+def get_db_connection():
+    import psycopg2
+    from psycopg2.extras import DictCursor
+    return psycopg2.connect(
+        os.getenv('DATABASE_URL'),
+        cursor_factory=DictCursor
+    )
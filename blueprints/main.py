@@ -0,0 +1,158 @@
+"""Dashboard, reports page, dashboard API stubs, PWA files and error handlers"""
+from flask import Blueprint, render_template, redirect, url_for, jsonify, session, send_from_directory, current_app
+from sqlalchemy import func
+from extensions import db
+from models import Product, Invoice, Settings
+from auth import check_permission, login_required, permission_required, get_current_user
+
+bp = Blueprint('main', __name__, cli_group=None)
+
+@bp.route('/')
+@login_required
+def index():
+    try:
+        # Get current user
+        user = get_current_user()
+        if not user:
+            session.clear()
+            return redirect(url_for('users.login'))
+
+        # Get settings
+        settings = Settings.query.first()
+        wallpaper_url = url_for('static', filename=f'wallpapers/{settings.wallpaper_path}') if settings and settings.wallpaper_path else None
+
+        # Initialize stats dictionary
+        stats = {
+            'total_products': 0,
+            'total_invoices': 0,
+            'total_sales': 0,
+            'recent_invoices': [],
+            'low_stock_products': [],
+            'total_inventory_cost': 0,
+            'stockout_count': 0
+        }
+
+        # Only show stats if user has appropriate permissions
+        if any(check_permission(name) for name in ('view_products', 'view_invoices', 'view_product_stock')):
+            try:
+                # Get basic stats that most users should see
+                if check_permission('view_products'):
+                    stats['total_products'] = db.session.query(func.count(Product.id)).scalar() or 0
+
+                if check_permission('view_invoices'):
+                    stats['total_invoices'] = db.session.query(func.count(Invoice.id)).scalar() or 0
+                    stats['total_sales'] = db.session.query(func.sum(Invoice.total_amount)).scalar() or 0
+                    stats['recent_invoices'] = Invoice.query.order_by(Invoice.date.desc()).limit(5).all()
+
+                # Stock-related stats for users with stock permissions
+                if check_permission('view_product_stock'):
+                    stats['low_stock_products'] = Product.query.filter(
+                        Product.stock <= Product.restock_level
+                    ).all()
+                    stats['stockout_count'] = db.session.query(
+                        func.count(Product.id)
+                    ).filter(Product.stock == 0).scalar() or 0
+                    
+                    # Calculate total inventory cost
+                    total_inventory = db.session.query(
+                        func.sum(Product.stock * Product.price)
+                    ).scalar()
+                    stats['total_inventory_cost'] = total_inventory or 0
+
+            except Exception as e:
+                print(f"Error calculating stats: {str(e)}")
+                # Continue with empty stats rather than failing completely
+
+        # Render template
+        return render_template('index.html', 
+                            stats=stats, 
+                            wallpaper_url=wallpaper_url,
+                            user=user)
+        
+    except Exception as e:
+        print(f"Error in index route: {str(e)}")
+        db.session.rollback()
+        return "An error occurred. Please try again.", 500
+
+@bp.route('/api/sales_trend')
+def sales_trend():
+    return jsonify({'labels': [], 'values': []})
+
+@bp.route('/api/top_products')
+def top_products():
+    return jsonify({'labels': [], 'values': []})
+
+@bp.route('/api/slow_moving_products')
+def slow_moving_products():
+    return jsonify({'labels': [], 'values': []})
+
+@bp.route('/api/stock_sales_ratio')
+def stock_sales_ratio():
+    return jsonify({'labels': [], 'values': []})
+
+@bp.route('/api/inventory_aging')
+def inventory_aging():
+    return jsonify({'labels': [], 'values': []})
+
+@bp.route('/api/sales_forecast')
+def sales_forecast():
+    return jsonify({'labels': [], 'values': []})
+
+@bp.route('/api/sales_performance')
+@login_required
+def sales_performance():
+    return jsonify({'labels': [], 'values': []})
+
+@bp.route('/api/sales_growth')
+@login_required
+def sales_growth():
+    return jsonify({'labels': [], 'values': []})
+
+@bp.route('/api/sales_trend_by_period')
+@login_required
+def sales_trend_by_period():
+    return jsonify({'labels': [], 'values': []})
+
+@bp.route('/reports')
+@login_required
+@permission_required('view_reports')
+def reports():
+    return redirect(url_for('main.index'))
+
+@bp.route('/offline.html')
+def offline():
+    return render_template('offline.html')
+
+# Add error handlers
+@bp.app_errorhandler(500)
+def internal_error(error):
+    db.session.rollback()
+    return "Internal Server Error. Please try again.", 500
+
+@bp.app_errorhandler(504)
+def gateway_timeout(error):
+    return "Request timed out. Please try again.", 504
+
+@bp.route('/sw.js')
+def service_worker():
+    # Served from the root so the worker's scope covers the whole app
+    response = send_from_directory(current_app.root_path, 'sw.js', mimetype='application/javascript', max_age=0)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@bp.route('/manifest.json')
+def manifest():
+    sizes = [48, 72, 96, 128, 144, 152, 192, 256, 384, 512]
+    return jsonify({
+        'name': 'Inventory System',
+        'short_name': 'Inventory',
+        'start_url': url_for('invoices.new_invoice'),
+        'display': 'standalone',
+        'background_color': '#ffffff',
+        'theme_color': '#ffffff',
+        'icons': [{
+            'src': url_for('static', filename=f'icons/icon-{size}x{size}.png'),
+            'sizes': f'{size}x{size}',
+            'type': 'image/png'
+        } for size in sizes]
+    })
@@ -0,0 +1,864 @@
+"""Products: catalogue, editing, stock takes, stock history and import/export"""
+from flask import Blueprint, render_template, request, jsonify, send_file, make_response, session, Response, stream_with_context
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+import io
+import csv
+import math
+import traceback
+import time
+import gzip
+import orjson
+from extensions import db, cache
+from models import Product, DeletedProduct, StockTake, StockTakeLine, StockMovement, Invoice, InvoiceItem
+from auth import check_permission, login_required, permission_required
+from stock import _record_stock_movements, _record_closing_movements, _apply_stock_deltas, stock_as_of, checkpoint_stock
+from helpers import _text
+
+bp = Blueprint('products', __name__, cli_group=None)
+
+def _record_deleted_products(*criteria):
+    """Tombstone products matching criteria (before deleting them), close their stock and prune old tombstones"""
+    now = datetime.utcnow()
+    _record_closing_movements(*criteria)
+    db.session.execute(
+        db.insert(DeletedProduct).from_select(
+            ['product_id', 'deleted_at'],
+            db.select(Product.id, db.literal(now, db.DateTime)).where(*criteria)
+        )
+    )
+    DeletedProduct.query.filter(
+        DeletedProduct.deleted_at < now - timedelta(days=CATALOG_TOMBSTONE_DAYS)
+    ).delete(synchronize_session=False)
+
+# Helper function to delete products, invoices and invoice items
+def _delete_all_products():
+    InvoiceItem.query.delete()
+    Invoice.query.delete()
+    _record_deleted_products()
+    Product.query.delete()
+
+@bp.route('/products/search')
+@login_required
+def search_products():
+    query = request.args.get('q', '').lower()
+    search_terms = [term.strip() for term in query.split() if term.strip()]
+    
+    if not search_terms:
+        return jsonify([])
+    
+    # Build the search query
+    search_query = Product.query
+    
+    # Search across multiple fields with OR conditions
+    search_conditions = []
+    for term in search_terms:
+        term_conditions = []
+        # Search in item_code
+        term_conditions.append(Product.item_code.ilike(f'%{term}%'))
+        # Search in description
+        term_conditions.append(Product.description.ilike(f'%{term}%'))
+        # Search in tamil_name
+        term_conditions.append(Product.tamil_name.ilike(f'%{term}%'))
+        # Search in stock_locations
+        term_conditions.append(Product.stock_locations.ilike(f'%{term}%'))
+        # Search in tags
+        term_conditions.append(Product.tags.ilike(f'%{term}%'))
+        # Search in notes
+        term_conditions.append(Product.notes.ilike(f'%{term}%'))
+        # Search in UOM
+        term_conditions.append(Product.uom.ilike(f'%{term}%'))
+        
+        # Combine conditions for this term with OR
+        search_conditions.append(db.or_(*term_conditions))
+    
+    # Apply all term conditions with AND
+    search_query = search_query.filter(db.and_(*search_conditions))
+    
+    # Execute query and get results
+    products = search_query.order_by(Product.item_code).all()
+    
+    # Return serialized results with additional fields
+    return jsonify([{
+        **product.serialize,
+        'stock_locations_display': product.stock_locations or '',
+        'tags_display': product.tags or '',
+        'notes_display': product.notes or ''
+    } for product in products])
+
+# Product fields shipped to the invoice screen's client-side catalogue
+CATALOG_FIELDS = ['id', 'item_code', 'description', 'tamil_name', 'uom', 'price', 'stock', 'stock_locations', 'tags', 'notes']
+CATALOG_DELTA_OVERLAP = timedelta(seconds=60)  # Re-send recent changes in case a slow transaction committed late
+CATALOG_TOMBSTONE_DAYS = 30  # Clients older than this must reload the full snapshot
+
+def _catalog_version():
+    """Latest product change or deletion, used as the catalogue version"""
+    updated = db.session.query(func.max(Product.updated_at)).scalar()
+    deleted = db.session.query(func.max(DeletedProduct.deleted_at)).scalar()
+    latest = max([stamp for stamp in (updated, deleted) if stamp] or [datetime(1970, 1, 1)])
+    return latest.isoformat()
+
+def _catalog_fields():
+    """Catalogue fields the current user may see; stock needs view_invoice_stock"""
+    if check_permission('view_invoice_stock'):
+        return CATALOG_FIELDS
+    return [field for field in CATALOG_FIELDS if field != 'stock']
+
+def _catalog_columns(fields, *criteria):
+    """Products matching criteria as columnar data: one list per field"""
+    rows = db.session.query(*[getattr(Product, field) for field in fields]).filter(*criteria).order_by(Product.id).all()
+    return [list(column) for column in zip(*rows)] if rows else [[] for _ in fields]
+
+def _encode_catalog(payload):
+    body = orjson.dumps(payload)
+    return {'body': body, 'gzip': gzip.compress(body, 6)}
+
+def _catalog_response(encoded, etag=None):
+    response = make_response(encoded['body'])
+    response.mimetype = 'application/json'
+    if 'gzip' in request.accept_encodings:
+        response.set_data(encoded['gzip'])
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Vary'] = 'Accept-Encoding'
+    if etag:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@bp.route('/products/catalog')
+@login_required
+def product_catalog():
+    """Versioned snapshot of the product catalogue for client-side invoice search"""
+    version = _catalog_version()
+    fields = _catalog_fields()
+    etag = f'{version}-{len(fields)}'
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+        response.set_etag(etag)
+        return response
+    
+    # Encode and compress each snapshot version once per worker
+    cache_key = f'product_catalog_{len(fields)}'
+    cached = cache.get(cache_key)
+    if not cached or cached['etag'] != etag:
+        cached = _encode_catalog({'version': version, 'fields': fields, 'columns': _catalog_columns(fields)})
+        cached['etag'] = etag
+        cache.set(cache_key, cached, timeout=300)
+    
+    return _catalog_response(cached, etag)
+
+@bp.route('/products/catalog/delta')
+@login_required
+def product_catalog_delta():
+    """Products changed and deleted since a catalogue version"""
+    try:
+        since = datetime.fromisoformat(request.args['since'])
+    except (KeyError, ValueError):
+        return jsonify({'success': False, 'error': 'A valid since version is required'}), 400
+    
+    version = _catalog_version()
+    fields = _catalog_fields()
+    if since < datetime.utcnow() - timedelta(days=CATALOG_TOMBSTONE_DAYS):
+        # Tombstones this old may have been pruned, so the client needs a fresh snapshot
+        return _catalog_response(_encode_catalog({'version': version, 'reset': True}))
+    
+    window_start = since - CATALOG_DELTA_OVERLAP
+    deleted = [row.product_id for row in db.session.query(DeletedProduct.product_id).filter(
+        DeletedProduct.deleted_at >= window_start
+    )]
+    return _catalog_response(_encode_catalog({
+        'version': version,
+        'reset': False,
+        'fields': fields,
+        'columns': _catalog_columns(fields, Product.updated_at >= window_start),
+        'deleted': deleted
+    }))
+
+@bp.route('/products', methods=['GET', 'POST'])
+@login_required
+@permission_required('view_products')
+def products():
+    if request.method == 'POST':
+        # Check if user has edit permission
+        if not check_permission('edit_products'):
+            return jsonify({'success': False, 'error': 'Permission denied'})
+            
+        data = request.json
+        
+        # Server-side validation
+        if not all(key in data for key in ('item_code', 'description', 'uom', 'price')):
+            return jsonify({'success': False, 'error': 'Missing required data'})
+        
+        try:
+            # Convert and validate numeric fields
+            try:
+                price = float(data['price'])
+                stock = int(data.get('stock', 0))
+                restock_level = int(data.get('restock_level', 0))
+            except ValueError as e:
+                return jsonify({'success': False, 'error': f'Invalid numeric value: {str(e)}'})
+            
+            # Create new product
+            product = Product(
+                item_code=data['item_code'],
+                description=data['description'],
+                tamil_name=data.get('tamil_name', ''),
+                uom=data['uom'],
+                price=price,
+                stock=stock,
+                restock_level=restock_level,
+                stock_locations=data.get('stock_locations', ''),
+                tags=data.get('tags', ''),
+                notes=data.get('notes', '')
+            )
+            
+            db.session.add(product)
+            db.session.flush()
+            _record_stock_movements({None: {product.id: stock}}, 'opening')
+            db.session.commit()
+            return jsonify({'success': True})
+            
+        except IntegrityError:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': 'Item code already exists'})
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': str(e)})
+    
+    # GET request handling
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', 50, type=int)
+    
+    # Generate cache key based on page and per_page
+    cache_key = f'products_page_{page}_{per_page}'
+    cached_data = cache.get(cache_key)
+    
+    if cached_data:
+        return cached_data
+    
+    # Query with pagination
+    pagination = Product.query.order_by(Product.item_code).paginate(
+        page=page, 
+        per_page=per_page,
+        error_out=False
+    )
+    
+    products = pagination.items
+    total_pages = pagination.pages
+    total_items = pagination.total
+    
+    response = render_template(
+        'products.html',
+        products=products,
+        pagination=pagination,
+        total_pages=total_pages,
+        total_items=total_items,
+        current_page=page
+    )
+    
+    # Cache the response for 5 minutes
+    cache.set(cache_key, response, timeout=300)
+    
+    return response
+
+# Editable product fields: field -> (permission, converter, name used in errors)
+PRODUCT_FIELD_PERMISSIONS = {
+    'item_code': ('edit_product_code', None, 'item code'),
+    'description': ('edit_product_description', None, 'description'),
+    'tamil_name': ('edit_product_tamil', None, 'Tamil name'),
+    'uom': ('edit_product_uom', None, 'UOM'),
+    'price': ('edit_product_price', float, 'price'),
+    'stock': ('edit_product_stock', int, 'stock'),
+    'restock_level': ('edit_product_restock', int, 'restock level'),
+    'stock_locations': ('edit_product_locations', None, 'locations'),
+    'tags': ('edit_product_tags', None, 'tags'),
+    'notes': ('edit_product_notes', None, 'notes'),
+}
+PRODUCT_BULK_UPDATE_LIMIT = 5000
+
+def _editable_product_fields():
+    """Product fields the current user may edit"""
+    return frozenset(field for field, (permission, _, _) in PRODUCT_FIELD_PERMISSIONS.items() if check_permission(permission))
+
+def _product_changes(data, editable, skip=()):
+    """Validate and convert the product fields in data in a single pass.
+    
+    Unknown keys are ignored. Raises PermissionError naming the first field
+    the user may not edit, or ValueError for values that don't convert.
+    """
+    changes = {}
+    for field, value in data.items():
+        if field in skip or field not in PRODUCT_FIELD_PERMISSIONS:
+            continue
+        _, convert, name = PRODUCT_FIELD_PERMISSIONS[field]
+        if field not in editable:
+            raise PermissionError(f'Permission denied: Cannot edit {name}')
+        changes[field] = convert(value) if convert else value
+    return changes
+
+@bp.route('/products/<int:id>', methods=['PUT'])
+@login_required
+def update_product(id):
+    product = Product.query.get_or_404(id)
+    data = request.json
+    
+    try:
+        changes = _product_changes(data, _editable_product_fields())
+        if 'stock' in changes:
+            _apply_stock_deltas({product.id: changes.pop('stock') - (product.stock or 0)}, 'adjustment')
+        for field, value in changes.items():
+            setattr(product, field, value)
+        
+        db.session.commit()
+        return jsonify({'success': True})
+    except PermissionError as e:
+        return jsonify({'success': False, 'error': str(e)})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
+@bp.route('/products', methods=['PATCH'])
+@login_required
+def bulk_update_products():
+    """Update many products in one transaction.
+    
+    Body: {"products": [{"id": 1, "price": 12.5}, {"item_code": "A100", "stock": 40}, ...]}.
+    Rows are matched on id, or on item_code when no id is given (item_code is
+    then the key, not a change). Every row is checked against the same field
+    permissions as PUT /products/<id>; nothing is written unless all rows pass.
+    """
+    rows = (request.json or {}).get('products', [])
+    if not rows:
+        return jsonify({'success': False, 'error': 'No products provided'})
+    if len(rows) > PRODUCT_BULK_UPDATE_LIMIT:
+        return jsonify({'success': False, 'error': f'At most {PRODUCT_BULK_UPDATE_LIMIT} products per request'})
+    
+    editable = _editable_product_fields()
+    codes = [str(row['item_code']).strip() for row in rows if 'id' not in row and row.get('item_code') is not None]
+    ids_by_code = dict(db.session.query(Product.item_code, Product.id).filter(Product.item_code.in_(codes)).all()) if codes else {}
+    
+    updates = {}
+    not_found = []
+    try:
+        for index, row in enumerate(rows):
+            if 'id' in row:
+                product_id = int(row['id'])
+                changes = _product_changes(row, editable, skip=('id',))
+            else:
+                product_id = ids_by_code.get(str(row.get('item_code', '')).strip())
+                changes = _product_changes(row, editable, skip=('item_code',))
+            if product_id is None:
+                not_found.append(row.get('item_code'))
+                continue
+            if changes:
+                updates.setdefault(product_id, {}).update(changes)
+    except PermissionError as e:
+        return jsonify({'success': False, 'error': str(e)})
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': f'Row {index + 1}: {str(e)}'})
+    
+    try:
+        current_stock = dict(db.session.query(Product.id, func.coalesce(Product.stock, 0)).filter(Product.id.in_(updates)).all()) if updates else {}
+        not_found.extend(product_id for product_id in updates if product_id not in current_stock)
+        updated = sum(1 for product_id in updates if product_id in current_stock)
+        # Stock counts go through the ledger as deltas; the other fields are written directly
+        _apply_stock_deltas({
+            product_id: changes.pop('stock') - current_stock[product_id]
+            for product_id, changes in updates.items() if product_id in current_stock and 'stock' in changes
+        }, 'adjustment')
+        params = [{'id': product_id, **changes} for product_id, changes in updates.items() if product_id in current_stock and changes]
+        if params:
+            # ORM bulk UPDATE by primary key: one executemany per distinct set of columns
+            db.session.execute(db.update(Product), params)
+        db.session.commit()
+        return jsonify({'success': True, 'updated': updated, 'not_found': not_found})
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': 'Item code already exists'})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
+def apply_stock_take(counts, notes=None):
+    """Record a stock count and adjust stock to match, in one transaction.
+    
+    counts is a list of {"id" or "item_code", "counted"} dicts; a product listed
+    more than once (counted in several locations) is summed. Expected stock for
+    every product is read in one query and the variances are applied as deltas
+    in one UPDATE, so sales made while the take is being applied are kept.
+    Rows that don't resolve are returned as errors and skipped.
+    """
+    errors = []
+    parsed = []
+    for row_number, row in enumerate(counts, start=1):
+        product_id = _text(row.get('id'))
+        item_code = _text(row.get('item_code'))
+        try:
+            counted = float(_text(row.get('counted')) or '')
+            if not math.isfinite(counted):
+                raise ValueError(counted)
+            counted = int(counted)
+        except (ValueError, OverflowError):
+            errors.append({'row': row_number, 'error': 'Counted quantity must be a number'})
+            continue
+        if counted < 0:
+            errors.append({'row': row_number, 'error': 'Counted quantity cannot be negative'})
+            continue
+        if product_id is None and item_code is None:
+            errors.append({'row': row_number, 'error': 'Missing product id or item code'})
+            continue
+        parsed.append((row_number, product_id, item_code, counted))
+    
+    ids = {int(product_id) for _, product_id, _, _ in parsed if product_id and product_id.isdigit()}
+    codes = {item_code for _, product_id, item_code, _ in parsed if not product_id and item_code}
+    products = db.session.query(Product.id, Product.item_code, func.coalesce(Product.stock, 0).label('stock')).filter(
+        db.or_(Product.id.in_(ids), Product.item_code.in_(codes))
+    ).all() if ids or codes else []
+    by_id = {product.id: product for product in products}
+    by_code = {product.item_code: product for product in products}
+    
+    totals = {}
+    for row_number, product_id, item_code, counted in parsed:
+        product = by_id.get(int(product_id)) if product_id and product_id.isdigit() else by_code.get(item_code)
+        if product is None:
+            errors.append({'row': row_number, 'error': f'Unknown product {product_id or item_code}'})
+            continue
+        totals[product.id] = totals.get(product.id, 0) + counted
+    errors.sort(key=lambda error: error['row'])
+    
+    if not totals:
+        return None, errors
+    
+    stock_take = StockTake(user_id=session.get('user_id'), notes=notes)
+    db.session.add(stock_take)
+    db.session.flush()
+    
+    lines = [
+        {
+            'stock_take_id': stock_take.id,
+            'product_id': product_id,
+            'expected': by_id[product_id].stock,
+            'counted': counted,
+            'variance': counted - by_id[product_id].stock
+        }
+        for product_id, counted in totals.items()
+    ]
+    db.session.execute(db.insert(StockTakeLine), lines)
+    _apply_stock_deltas({line['product_id']: line['variance'] for line in lines}, 'stock_take', stock_take.id)
+    return stock_take, errors
+
+def _stock_take_summary(stock_take_id):
+    """Line count, adjusted lines and net variance of a stock take from one aggregate query"""
+    row = db.session.query(
+        func.count(StockTakeLine.id),
+        func.sum(db.case((StockTakeLine.variance != 0, 1), else_=0)),
+        func.coalesce(func.sum(StockTakeLine.variance), 0)
+    ).filter(StockTakeLine.stock_take_id == stock_take_id).one()
+    return {'lines': row[0], 'adjusted': int(row[1] or 0), 'net_variance': int(row[2])}
+
+@bp.route('/stock-takes', methods=['POST'])
+@login_required
+@permission_required('manage_stock')
+def create_stock_take():
+    """Apply a stock count given as JSON {"counts": [...], "notes": ...} or an uploaded sheet.
+    
+    Sheets need an Item Code column and a Counted (or Quantity) column.
+    """
+    import pandas as pd
+    
+    if 'file' in request.files:
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({'success': False, 'error': 'No file selected'}), 400
+        try:
+            if file.filename.lower().endswith('.csv'):
+                df = pd.read_csv(file, dtype=str, keep_default_na=False)
+            elif file.filename.lower().endswith(('.xlsx', '.xls')):
+                df = pd.read_excel(file)
+            else:
+                return jsonify({'success': False, 'error': 'Invalid file format. Please upload an Excel or CSV file.'}), 400
+        except Exception as e:
+            print(f"Error reading stock take file: {str(e)}")
+            return jsonify({'success': False, 'error': f'Error reading file: {str(e)}'}), 400
+        
+        df.columns = [str(column).strip().lower().replace(' ', '_') for column in df.columns]
+        df = df.rename(columns={'quantity': 'counted', 'counted_quantity': 'counted'})
+        if 'item_code' not in df.columns or 'counted' not in df.columns:
+            return jsonify({'success': False, 'error': 'The sheet needs Item Code and Counted columns'}), 400
+        counts = df.to_dict('records')
+        notes = request.form.get('notes') or f'Imported from {file.filename}'
+        row_offset = 1  # Spreadsheet row numbers (row 1 is the header)
+    else:
+        data = request.json or {}
+        counts = data.get('counts', [])
+        notes = data.get('notes')
+        row_offset = 0
+    
+    if not counts:
+        return jsonify({'success': False, 'error': 'No counts provided'}), 400
+    
+    try:
+        stock_take, errors = apply_stock_take(counts, notes)
+        for error in errors:
+            error['row'] += row_offset
+        if stock_take is None:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': 'No valid counts', 'errors': errors})
+        db.session.commit()
+        print(f"Stock take {stock_take.id} applied with {len(errors)} skipped rows")
+        return jsonify({'success': True, 'id': stock_take.id, **_stock_take_summary(stock_take.id), 'errors': errors})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@bp.route('/stock-takes/<int:id>')
+@login_required
+@permission_required('manage_stock')
+def stock_take_detail(id):
+    """A stock take's lines; ?variances_only=1 leaves out lines that matched"""
+    stock_take = StockTake.query.get_or_404(id)
+    query = db.session.query(
+        StockTakeLine.product_id, Product.item_code, Product.description,
+        StockTakeLine.expected, StockTakeLine.counted, StockTakeLine.variance
+    ).outerjoin(Product, Product.id == StockTakeLine.product_id).filter(StockTakeLine.stock_take_id == id)
+    if request.args.get('variances_only'):
+        query = query.filter(StockTakeLine.variance != 0)
+    return jsonify({
+        'success': True,
+        'id': stock_take.id,
+        'created_at': stock_take.created_at.strftime('%Y-%m-%d %H:%M'),
+        'notes': stock_take.notes,
+        **_stock_take_summary(id),
+        'items': [dict(line._mapping) for line in query.order_by(Product.item_code)]
+    })
+
+STOCK_MOVEMENTS_PAGE_SIZE = 100
+
+@bp.route('/products/<int:id>/stock-movements')
+@login_required
+@permission_required('view_product_stock')
+def product_stock_movements(id):
+    """A product's stock movements, newest first, paged with ?before=<movement id>"""
+    product = Product.query.get_or_404(id)
+    limit = min(request.args.get('limit', STOCK_MOVEMENTS_PAGE_SIZE, type=int), 500)
+    query = StockMovement.query.filter(StockMovement.product_id == id)
+    before = request.args.get('before', type=int)
+    if before:
+        query = query.filter(StockMovement.id < before)
+    movements = query.order_by(StockMovement.id.desc()).limit(limit + 1).all()
+    return jsonify({
+        'success': True,
+        'product_id': product.id,
+        'stock': product.stock,
+        'movements': [{
+            'id': movement.id,
+            'quantity': movement.quantity,
+            'reason': movement.reason,
+            'reference_id': movement.reference_id,
+            'user_id': movement.user_id,
+            'created_at': movement.created_at.strftime('%Y-%m-%d %H:%M:%S')
+        } for movement in movements[:limit]],
+        'has_more': len(movements) > limit
+    })
+
+@bp.route('/reports/stock-as-of')
+@login_required
+@permission_required('view_product_stock')
+def stock_as_of_report():
+    """Stock of every product at the end of ?date=YYYY-MM-DD, as CSV (streamed) or ?format=json"""
+    try:
+        day = datetime.strptime(request.args.get('date', ''), '%Y-%m-%d')
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Date must be in YYYY-MM-DD format'}), 400
+    
+    levels = stock_as_of(day + timedelta(days=1) - timedelta(microseconds=1)).subquery()
+    query = db.select(Product.id, Product.item_code, Product.description, Product.uom, levels.c.stock).join(
+        levels, levels.c.product_id == Product.id
+    ).order_by(Product.item_code)
+    
+    if request.args.get('format') == 'json':
+        return jsonify({
+            'success': True,
+            'date': day.strftime('%Y-%m-%d'),
+            'products': [dict(row._mapping) for row in db.session.execute(query)]
+        })
+    
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(['Item Code', 'Description', 'UOM', 'Stock'])
+        for count, row in enumerate(db.session.execute(query.execution_options(yield_per=500)), start=1):
+            writer.writerow([row.item_code, row.description, row.uom, row.stock])
+            if count % 500 == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
+        yield buffer.getvalue()
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f"attachment; filename=stock_{day.strftime('%Y-%m-%d')}.csv"}
+    )
+
+@bp.route('/products/<int:id>', methods=['DELETE'])
+@login_required
+@permission_required('delete_products')
+def delete_product(id):
+    product = Product.query.get_or_404(id)
+    
+    try:
+        # Check if product has any invoice items
+        if product.invoice_items:
+            return jsonify({
+                'success': False, 
+                'error': 'Cannot delete product with existing invoices. Please delete related invoices first.'
+            }), 400
+            
+        _record_deleted_products(Product.id == product.id)
+        db.session.delete(product)
+        db.session.commit()
+        return jsonify({'success': True})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@bp.route('/products/import', methods=['POST'])
+@login_required
+@permission_required('import_products')
+def import_products():
+    import openpyxl
+    
+    try:
+        if 'file' not in request.files:
+            print("No file in request.files")
+            return jsonify({'success': False, 'error': 'No file uploaded'}), 400
+
+        file = request.files['file']
+        if file.filename == '':
+            print("Empty filename")
+            return jsonify({'success': False, 'error': 'No file selected'}), 400
+        
+        if not file.filename.endswith(('.xlsx', '.xls')):
+            print(f"Invalid file type: {file.filename}")
+            return jsonify({'success': False, 'error': 'Invalid file format. Please upload an Excel file.'}), 400
+        
+        print(f"Processing file: {file.filename}")
+        
+        # Initialize counters and error list
+        total_count = 0
+        imported_count = 0
+        error_details = []
+        products = []
+        batch_size = 20
+        current_batch = []
+        batch_number = 0
+        
+        try:
+            # Read the Excel file
+            wb = openpyxl.load_workbook(file, data_only=True)
+            sheet = wb.active
+            
+            # Get total number of rows for progress calculation
+            total_rows = sum(1 for row in sheet.iter_rows(min_row=2) if any(cell.value for cell in row))
+            
+            # Validate header row
+            header_row = next(sheet.iter_rows(min_row=1, max_row=1))
+            if len(header_row) < 6:
+                print("Invalid header row")
+                return jsonify({'success': False, 'error': 'Invalid file format. Missing required columns.'}), 400
+            
+            # Process data rows
+            for row_idx, row in enumerate(sheet.iter_rows(min_row=2), start=2):
+                total_count += 1
+                try:
+                    # Skip empty rows
+                    if not any(cell.value for cell in row):
+                        continue
+                        
+                    # Basic validation
+                    if not row[0].value or not row[1].value or not row[3].value:
+                        error_details.append(f"Row {row_idx}: Missing required fields (Item Code, Description, or UOM)")
+                        continue
+                    
+                    # Handle price and stock
+                    try:
+                        price = float(str(row[4].value or '0').replace(',', ''))
+                        stock = int(float(str(row[5].value or '0').replace(',', '')))
+                    except (ValueError, TypeError) as e:
+                        error_details.append(f"Row {row_idx}: Invalid price or stock value")
+                        print(f"Error parsing price/stock in row {row_idx}: {str(e)}")
+                        continue
+                    
+                    product = {
+                        'item_code': str(row[0].value).strip(),
+                        'description': str(row[1].value).strip(),
+                        'tamil_name': str(row[2].value).strip() if row[2].value else None,
+                        'uom': str(row[3].value).strip(),
+                        'price': price,
+                        'stock': stock,
+                        'restock_level': int(float(str(row[6].value or '0').replace(',', ''))),
+                        'stock_locations': str(row[7].value).strip() if len(row) > 7 and row[7].value else None,
+                        'tags': str(row[8].value).strip() if len(row) > 8 and row[8].value else None,
+                        'notes': str(row[9].value).strip() if len(row) > 9 and row[9].value else None
+                    }
+                    current_batch.append(product)
+                    
+                    # Process batch when it reaches batch_size
+                    if len(current_batch) >= batch_size:
+                        batch_number += 1
+                        batch_result = process_product_batch(current_batch, error_details, batch_number)
+                        imported_count += batch_result
+                        current_batch = []
+                        time.sleep(1)  # Add a 1-second delay between batches
+                        
+                except Exception as e:
+                    error_details.append(f"Row {row_idx}: {str(e)}")
+                    print(f"Error processing row {row_idx}: {str(e)}")
+                    continue
+            
+            # Process remaining products in the last batch
+            if current_batch:
+                batch_number += 1
+                imported_count += process_product_batch(current_batch, error_details, batch_number)
+            
+            response_data = {
+                'success': imported_count > 0,
+                'message': f"Successfully imported {imported_count} products.",
+                'total_count': total_count,
+                'imported_count': imported_count,
+                'error_count': len(error_details),
+                'error_details': error_details,
+                'total_batches': batch_number
+            }
+            print(f"Import completed: {response_data}")
+            return jsonify(response_data), 200 if imported_count > 0 else 400
+            
+        except Exception as e:
+            print(f"Error reading Excel file: {str(e)}")
+            return jsonify({
+                'success': False,
+                'error': f"Error reading Excel file: {str(e)}",
+                'total_count': total_count,
+                'imported_count': imported_count,
+                'error_count': len(error_details),
+                'error_details': error_details
+            }), 400
+            
+    except Exception as e:
+        print(f"Unexpected error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f"Import failed: {str(e)}",
+            'details': traceback.format_exc()
+        }), 500
+
+def process_product_batch(batch, error_details, batch_number):
+    """Process a batch of products and return the number of successfully imported products"""
+    imported_count = 0
+    
+    print(f"Processing batch {batch_number} with {len(batch)} products")
+    
+    for product_data in batch:
+        try:
+            # Validate item_code format
+            if not product_data['item_code'] or len(product_data['item_code']) > 20:
+                error_details.append(f"Invalid item code format: {product_data['item_code']}")
+                continue
+            
+            product = Product.query.filter_by(item_code=product_data['item_code']).first()
+            if product:
+                # Update existing product; the stock difference goes through the ledger
+                stock = product_data.pop('stock')
+                for key, value in product_data.items():
+                    setattr(product, key, value)
+                _apply_stock_deltas({product.id: stock - (product.stock or 0)}, 'import')
+            else:
+                # Create new product
+                product = Product(**product_data)
+                db.session.add(product)
+                db.session.flush()
+                _record_stock_movements({None: {product.id: product.stock}}, 'opening')
+            
+            db.session.commit()
+            imported_count += 1
+            print(f"Imported product: {product_data['item_code']}")
+        except Exception as e:
+            db.session.rollback()
+            error_details.append(f"Error with item code {product_data['item_code']}: {str(e)}")
+            print(f"Error importing product {product_data['item_code']}: {str(e)}")
+            continue
+    
+    print(f"Completed batch {batch_number}: {imported_count} products imported successfully")
+    return imported_count
+
+@bp.route('/products/export')
+@login_required
+@permission_required('export_products')
+def export_products():
+    import pandas as pd
+    
+    products = Product.query.all()
+    
+    # Create DataFrame with all fields
+    df = pd.DataFrame([{
+        'Item Code': p.item_code,
+        'Description': p.description,
+        'Tamil Name': p.tamil_name,
+        'UOM': p.uom,
+        'Price': p.price,
+        'Stock': p.stock,
+        'Restock Level': p.restock_level,
+        'Stock Locations': p.stock_locations,
+        'Tags': p.tags,
+        'Notes': p.notes
+    } for p in products])
+
+    output = io.BytesIO()
+    writer = pd.ExcelWriter(output, engine='xlsxwriter')
+    workbook = writer.book
+    
+    # Add formats
+    header_format = workbook.add_format({
+        'bold': True,
+        'text_wrap': True,
+        'valign': 'top',
+        'bg_color': '#D9D9D9',
+        'border': 1
+    })
+    
+    # Write DataFrame to Excel
+    df.to_excel(writer, sheet_name='Products', index=False)
+    
+    # Get the worksheet object
+    worksheet = writer.sheets['Products']
+    
+    # Format the header row
+    for col_num, value in enumerate(df.columns.values):
+        worksheet.write(0, col_num, value, header_format)
+        worksheet.set_column(col_num, col_num, 15)  # Set column width
+    
+    # Set specific column widths
+    worksheet.set_column('B:B', 30)  # Description column
+    worksheet.set_column('C:C', 20)  # Tamil Name column
+    worksheet.set_column('H:H', 25)  # Stock Locations column
+    worksheet.set_column('I:I', 20)  # Tags column
+    worksheet.set_column('J:J', 30)  # Notes column
+    
+    writer.close()
+    output.seek(0)
+
+    return send_file(
+        output,
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        as_attachment=True,
+        download_name='products.xlsx'
+    )
+
+@bp.cli.command('checkpoint-stock')
+def checkpoint_stock_command():
+    """Write stock checkpoints for products that moved since the last run (run from cron)"""
+    count = checkpoint_stock()
+    db.session.commit()
+    print(f"Wrote {count} stock checkpoints")
@@ -0,0 +1,473 @@
+"""Settings: print templates, wallpaper, calculator code, backup/restore and data deletion"""
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
+from datetime import datetime
+from sqlalchemy import func
+from jinja2 import TemplateSyntaxError
+import os
+from extensions import db, pool_usage
+from models import Product, Customer, CustomerTransaction, CustomerReceivable, Invoice, InvoiceItem, PrintTemplate, Settings
+from auth import login_required, permission_required, admin_required
+from stock import _record_stock_movements, _apply_stock_deltas
+from blueprints.products import _record_deleted_products, _delete_all_products
+
+bp = Blueprint('settings', __name__, cli_group=None)
+
+# Helper function to delete invoices and invoice items
+def _delete_all_invoices(restore_stock=False):
+    if restore_stock:
+        # Restore stock for all items, summed per product
+        returned = db.session.query(InvoiceItem.product_id, func.sum(InvoiceItem.quantity)).group_by(InvoiceItem.product_id).all()
+        _apply_stock_deltas(dict(returned), 'invoice_delete')
+    
+    InvoiceItem.query.delete()
+    Invoice.query.delete()
+
+@bp.route('/settings/print-templates')
+def print_templates():
+    invoice_templates = PrintTemplate.query.filter_by(type='invoice').all()
+    summary_templates = PrintTemplate.query.filter_by(type='summary').all()
+    return render_template('settings/print_templates.html',
+                         invoice_templates=invoice_templates,
+                         summary_templates=summary_templates)
+
+@bp.route('/settings/print-templates/new', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def new_print_template():
+    if request.method == 'POST':
+        data = request.json
+        template = PrintTemplate(
+            name=data['name'],
+            type=data['type'],
+            content=data['content'],
+            is_default=data.get('is_default', False)
+        )
+        
+        try:
+            # Reject templates that don't compile before they can break printing
+            current_app.jinja_env.from_string(template.content)
+        except TemplateSyntaxError as e:
+            return jsonify({'success': False, 'error': f'Template error on line {e.lineno}: {e.message}'})
+        
+        if template.is_default:
+            # Remove default flag from other templates of same type
+            PrintTemplate.query.filter_by(type=template.type, is_default=True).update({'is_default': False})
+        
+        try:
+            db.session.add(template)
+            db.session.commit()
+            return jsonify({'success': True, 'id': template.id})
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': str(e)})
+    
+    return render_template('print_template_form.html', template=None)
+
+@bp.route('/settings/print-templates/<int:id>', methods=['GET', 'PUT', 'DELETE'])
+@login_required
+@admin_required
+def print_template(id):
+    template = PrintTemplate.query.get_or_404(id)
+    
+    if request.method == 'GET':
+        return render_template('print_template_form.html', template=template)
+    
+    elif request.method == 'PUT':
+        data = request.json
+        try:
+            current_app.jinja_env.from_string(data['content'])
+        except TemplateSyntaxError as e:
+            return jsonify({'success': False, 'error': f'Template error on line {e.lineno}: {e.message}'})
+        
+        template.name = data['name']
+        template.content = data['content']
+        template.is_default = data.get('is_default', False)
+        
+        if template.is_default:
+            # Remove default flag from other templates of same type
+            PrintTemplate.query.filter(
+                PrintTemplate.type == template.type,
+                PrintTemplate.id != template.id,
+                PrintTemplate.is_default == True
+            ).update({'is_default': False})
+        
+        try:
+            db.session.commit()
+            invalidate_print_template(id)
+            return jsonify({'success': True})
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': str(e)})
+    
+    elif request.method == 'DELETE':
+        if template.is_default:
+            return jsonify({'success': False, 'error': 'Cannot delete default template'})
+        
+        try:
+            db.session.delete(template)
+            db.session.commit()
+            invalidate_print_template(id)
+            return jsonify({'success': True})
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': str(e)})
+
+# Built-in template used for each print template type
+BUILTIN_PRINT_TEMPLATES = {
+    'invoice': 'print_invoice.html',
+    'summary': 'print_summary.html'
+}
+
+# Compiled PrintTemplates for this worker: id -> (updated_at, jinja Template)
+_compiled_print_templates = {}
+
+def compile_print_template(id, updated_at):
+    """Compile a PrintTemplate once per worker, recompiling only when updated_at changes.
+    
+    The template body is only loaded from the database when it has to be compiled.
+    """
+    cached = _compiled_print_templates.get(id)
+    if cached and cached[0] == updated_at:
+        return cached[1]
+    
+    content = db.session.query(PrintTemplate.content).filter(PrintTemplate.id == id).scalar()
+    compiled = current_app.jinja_env.from_string(content)
+    _compiled_print_templates[id] = (updated_at, compiled)
+    return compiled
+
+def invalidate_print_template(id):
+    _compiled_print_templates.pop(id, None)
+
+def render_print_template(type, template_id=None, **context):
+    """Render a print using the requested or default PrintTemplate, or the built-in template"""
+    query = db.session.query(PrintTemplate.id, PrintTemplate.updated_at).filter(PrintTemplate.type == type)
+    if template_id:
+        query = query.filter(PrintTemplate.id == template_id)
+    else:
+        query = query.filter(PrintTemplate.is_default == True)
+    row = query.first()
+    
+    if not row:
+        return render_template(BUILTIN_PRINT_TEMPLATES[type], **context)
+    
+    compiled = compile_print_template(row.id, row.updated_at)
+    current_app.update_template_context(context)
+    return compiled.render(context)
+
+def get_default_template(type):
+    template = PrintTemplate.query.filter_by(type=type, is_default=True).first()
+    if not template:
+        # Create default template if none exists, reusing the source Jinja already loaded
+        content, _, _ = current_app.jinja_loader.get_source(current_app.jinja_env, BUILTIN_PRINT_TEMPLATES[type])
+        
+        template = PrintTemplate(
+            name=f'Default {type.title()} Template',
+            type=type,
+            content=content,
+            is_default=True
+        )
+        db.session.add(template)
+        db.session.commit()
+    
+    return template
+
+@bp.route('/settings')
+@login_required
+@permission_required('manage_settings')
+def settings():
+    # Get print templates
+    invoice_templates = PrintTemplate.query.filter_by(type='invoice').all()
+    summary_templates = PrintTemplate.query.filter_by(type='summary').all()
+    settings = Settings.query.first()
+    current_wallpaper = url_for('static', filename=f'wallpapers/{settings.wallpaper_path}') if settings and settings.wallpaper_path else None
+    
+    return render_template('settings.html', 
+                         invoice_templates=invoice_templates,
+                         summary_templates=summary_templates,
+                         current_wallpaper=current_wallpaper)
+
+@bp.route('/settings/upload-wallpaper', methods=['POST'])
+@login_required
+@admin_required
+def upload_wallpaper():
+    if 'wallpaper' not in request.files:
+        flash('No file uploaded', 'error')
+        return redirect(url_for('settings.settings'))
+    
+    file = request.files['wallpaper']
+    if file.filename == '':
+        flash('No file selected', 'error')
+        return redirect(url_for('settings.settings'))
+    
+    if file and file.filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
+        # Create wallpapers directory if it doesn't exist
+        wallpapers_dir = os.path.join(current_app.static_folder, 'wallpapers')
+        if not os.path.exists(wallpapers_dir):
+            os.makedirs(wallpapers_dir)
+        
+        # Save the file
+        filename = f'wallpaper_{datetime.now().strftime("%Y%m%d_%H%M%S")}{os.path.splitext(file.filename)[1]}'
+        file.save(os.path.join(wallpapers_dir, filename))
+        
+        # Update settings
+        settings = Settings.query.first()
+        if not settings:
+            settings = Settings()
+            db.session.add(settings)
+        
+        # Remove old wallpaper if it exists
+        if settings.wallpaper_path:
+            old_wallpaper_path = os.path.join(wallpapers_dir, settings.wallpaper_path)
+            if os.path.exists(old_wallpaper_path):
+                os.remove(old_wallpaper_path)
+        
+        settings.wallpaper_path = filename
+        db.session.commit()
+        
+        flash('Wallpaper updated successfully', 'success')
+    else:
+        flash('Invalid file type. Please upload an image file.', 'error')
+    
+    return redirect(url_for('settings.settings'))
+
+@bp.route('/settings/remove-wallpaper', methods=['POST'])
+@login_required
+@admin_required
+def remove_wallpaper():
+    settings = Settings.query.first()
+    if settings and settings.wallpaper_path:
+        # Remove the file
+        wallpaper_path = os.path.join(current_app.static_folder, 'wallpapers', settings.wallpaper_path)
+        if os.path.exists(wallpaper_path):
+            os.remove(wallpaper_path)
+        
+        # Clear the path in settings
+        settings.wallpaper_path = None
+        db.session.commit()
+        
+        flash('Wallpaper removed successfully', 'success')
+    
+    return redirect(url_for('settings.settings'))
+
+@bp.route('/settings/calculator-code', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def calculator_code():
+    if request.method == 'POST':
+        try:
+            data = request.get_json()
+            code = data.get('code')
+            if not code:
+                return jsonify({'error': 'Code is required'}), 400
+                
+            settings = Settings.query.first()
+            if not settings:
+                settings = Settings()
+                db.session.add(settings)
+            
+            settings.calculator_code = code
+            print(f"Updating calculator code to: {code}")  # Debug log
+            
+            try:
+                db.session.commit()
+                print("Database commit successful")  # Debug log
+                return jsonify({'success': True, 'code': settings.calculator_code})
+            except Exception as e:
+                print(f"Database commit failed: {str(e)}")  # Debug log
+                db.session.rollback()
+                return jsonify({'error': f'Failed to save code: {str(e)}'}), 500
+                
+        except Exception as e:
+            print(f"Error in calculator code update: {str(e)}")  # Debug log
+            return jsonify({'error': str(e)}), 500
+    else:
+        try:
+            settings = Settings.query.first()
+            code = settings.calculator_code if settings else '9999'
+            print(f"Current calculator code: {code}")  # Debug log
+            return jsonify({'code': code})
+        except Exception as e:
+            print(f"Error retrieving calculator code: {str(e)}")  # Debug log
+            return jsonify({'error': str(e)}), 500
+
+@bp.route('/settings/backup')
+@login_required
+@admin_required
+def backup_data():
+    # Get all data from database
+    products = Product.query.all()
+    invoices = Invoice.query.all()
+    invoice_items = InvoiceItem.query.all()
+    templates = PrintTemplate.query.all()
+    settings = Settings.query.first()
+    
+    # Create backup data structure
+    backup = {
+        'products': [{
+            'item_code': p.item_code,
+            'description': p.description,
+            'uom': p.uom,
+            'price': p.price,
+            'stock': p.stock,
+            'restock_level': p.restock_level,
+            'tamil_name': p.tamil_name
+        } for p in products],
+        'invoices': [{
+            'order_number': i.order_number,
+            'date': i.date.isoformat(),
+            'customer_name': i.customer_name,
+            'total_amount': i.total_amount,
+            'total_items': i.total_items
+        } for i in invoices],
+        'invoice_items': [{
+            'invoice_order_number': ii.invoice.order_number,
+            'product_item_code': ii.product.item_code,
+            'quantity': ii.quantity,
+            'price': ii.price,
+            'amount': ii.amount
+        } for ii in invoice_items],
+        'templates': [{
+            'name': t.name,
+            'type': t.type,
+            'content': t.content,
+            'is_default': t.is_default
+        } for t in templates],
+        'settings': {
+            'calculator_code': settings.calculator_code if settings else '9999',
+            'wallpaper_path': settings.wallpaper_path if settings and settings.wallpaper_path else None
+        }
+    }
+    
+    return jsonify(backup)
+
+@bp.route('/settings/restore', methods=['POST'])
+@login_required
+@admin_required
+def restore_data():
+    try:
+        data = request.get_json()
+        
+        # Clear existing data
+        PrintTemplate.query.delete()
+        InvoiceItem.query.delete()
+        Invoice.query.delete()
+        _record_deleted_products()
+        Product.query.delete()
+        Settings.query.delete()
+        
+        # Restore products
+        restored = [Product(**product_data) for product_data in data.get('products', [])]
+        db.session.add_all(restored)
+        db.session.flush()
+        _record_stock_movements({None: {product.id: product.stock or 0 for product in restored}}, 'opening')
+        
+        # Restore invoices
+        for invoice_data in data.get('invoices', []):
+            date_str = invoice_data.pop('date')
+            invoice_data['date'] = datetime.fromisoformat(date_str).date()
+            invoice = Invoice(**invoice_data)
+            db.session.add(invoice)
+            
+            # Restore invoice items
+        for item_data in data.get('invoice_items', []):
+            invoice = Invoice.query.filter_by(order_number=item_data['invoice_order_number']).first()
+            product = Product.query.filter_by(item_code=item_data['product_item_code']).first()
+            if invoice and product:
+                item = InvoiceItem(
+                    invoice=invoice,
+                    product=product,
+                    quantity=item_data['quantity'],
+                    price=item_data['price'],
+                    amount=item_data['amount']
+                )
+                db.session.add(item)
+        
+        # Restore templates
+        for template_data in data.get('templates', []):
+            template = PrintTemplate(**template_data)
+            db.session.add(template)
+        
+        # Restore settings
+        settings_data = data.get('settings', {})
+        settings = Settings(
+            calculator_code=settings_data.get('calculator_code', '9999'),
+            wallpaper_path=settings_data.get('wallpaper_path')
+        )
+        db.session.add(settings)
+        
+        db.session.commit()
+        _compiled_print_templates.clear()
+        return jsonify({'success': True})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
+@bp.route('/settings/delete-invoices', methods=['POST'])
+@login_required
+@admin_required
+def delete_invoices():
+    try:
+        data = request.json
+        restore_stock = data.get('restore_stock', False)
+        _delete_all_invoices(restore_stock)
+        db.session.commit()
+        return jsonify({'success': True})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
+@bp.route('/settings/delete-products', methods=['POST'])
+@login_required
+@admin_required
+def delete_products():
+    try:
+        _delete_all_products()
+        db.session.commit()
+        return jsonify({'success': True})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
+@bp.route('/settings/delete-all', methods=['POST'])
+@login_required
+@admin_required
+def delete_all():
+    try:
+        _delete_all_products()  # This also deletes invoices
+        PrintTemplate.query.delete()
+        CustomerTransaction.query.delete()
+        CustomerReceivable.query.delete()
+        Customer.query.delete()
+        settings = Settings.query.first()
+        if settings:
+            settings.calculator_code = '9999'
+        db.session.commit()
+        _compiled_print_templates.clear()
+        return jsonify({'success': True})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
+@bp.route('/settings/print-templates/<int:id>', methods=['DELETE'])
+@login_required
+@admin_required
+def delete_print_template(id):
+    template = PrintTemplate.query.get_or_404(id)
+    if template.is_default:
+        return jsonify({'success': False, 'error': 'Cannot delete default template'})
+    
+    try:
+        db.session.delete(template)
+        db.session.commit()
+        invalidate_print_template(id)
+        return jsonify({'success': True})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
+@bp.route('/settings/db-pool')
+@login_required
+@admin_required
+def db_pool_usage():
+    # Each worker has its own pool; this reports the worker that served the request
+    return jsonify({'success': True, **pool_usage(db.engine)})
@@ -0,0 +1,634 @@
+"""Suppliers, supplier price lists and purchase orders"""
+from flask import Blueprint, render_template, request, jsonify, send_file
+from datetime import datetime
+from sqlalchemy import func
+import io
+from extensions import db
+from models import Product, Supplier, supplier_products, PurchaseOrder, PurchaseOrderItem
+from auth import login_required, permission_required
+from stock import _apply_stock_deltas
+from helpers import _escape_like, _text
+
+bp = Blueprint('suppliers', __name__, cli_group=None)
+
+SUPPLIER_IMPORT_CHUNK_SIZE = 1000  # Item codes looked up / upserted per statement
+
+def _supplier_products_insert():
+    """INSERT for supplier_products supporting ON CONFLICT on PostgreSQL and SQLite"""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(supplier_products)
+
+def link_products_to_supplier(supplier_id, *criteria):
+    """Link every product matching criteria in one INSERT ... SELECT, skipping existing links.
+    
+    Returns the number of new links.
+    """
+    stmt = _supplier_products_insert().from_select(
+        ['supplier_id', 'product_id'],
+        db.select(db.literal(supplier_id, db.Integer), Product.id).where(*criteria)
+    ).on_conflict_do_nothing(index_elements=['supplier_id', 'product_id'])
+    return db.session.execute(stmt).rowcount
+
+def import_supplier_price_list(supplier_id, entries):
+    """Link products by item code and record supplier prices.
+    
+    entries is a list of (item_code, price or None). Codes are resolved in
+    chunks with one SELECT each and links are upserted with one batched INSERT
+    ... ON CONFLICT DO UPDATE per chunk; a missing price keeps the stored one.
+    Returns (number of products matched, list of unknown codes).
+    """
+    prices = {}
+    for item_code, price in entries:
+        prices[item_code] = price if price is not None else prices.get(item_code)
+    
+    codes = list(prices)
+    matched = 0
+    unknown = []
+    for start in range(0, len(codes), SUPPLIER_IMPORT_CHUNK_SIZE):
+        chunk = codes[start:start + SUPPLIER_IMPORT_CHUNK_SIZE]
+        ids = dict(db.session.query(Product.item_code, Product.id).filter(Product.item_code.in_(chunk)).all())
+        unknown.extend(code for code in chunk if code not in ids)
+        if not ids:
+            continue
+        
+        stmt = _supplier_products_insert()
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['supplier_id', 'product_id'],
+            set_={'supplier_price': func.coalesce(stmt.excluded.supplier_price, supplier_products.c.supplier_price)}
+        )
+        db.session.execute(stmt, [
+            {'supplier_id': supplier_id, 'product_id': product_id, 'supplier_price': prices[code]}
+            for code, product_id in ids.items()
+        ])
+        matched += len(ids)
+    return matched, unknown
+
+# Add supplier routes
+@bp.route('/suppliers')
+@login_required
+def suppliers():
+    suppliers = Supplier.query.all()
+    return render_template('suppliers.html', suppliers=suppliers)
+
+@bp.route('/suppliers', methods=['POST'])
+@login_required
+def add_supplier():
+    data = request.json
+    
+    # Server-side validation
+    if not data.get('name'):
+        return jsonify({'success': False, 'error': 'Name is required'})
+    
+    supplier = Supplier(
+        name=data['name'],
+        phone=data.get('phone'),
+        email=data.get('email'),
+        address=data.get('address')
+    )
+    
+    try:
+        db.session.add(supplier)
+        db.session.commit()
+        return jsonify({'success': True, 'id': supplier.id})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
+SUPPLIER_LOW_STOCK = 10
+SUPPLIER_MEDIUM_STOCK = 30
+SUPPLIER_PICKER_PAGE_SIZE = 50
+
+def _stock_sort_order(sort_by):
+    """ORDER BY terms for the low/medium/high stock sort options"""
+    stock = func.coalesce(Product.stock, 0)
+    if sort_by == 'low_stock':
+        return [stock]
+    if sort_by == 'medium_stock':
+        return [func.abs(stock - SUPPLIER_MEDIUM_STOCK)]
+    if sort_by == 'high_stock':
+        return [stock.desc()]
+    return []
+
+def _product_term_filter(query, text):
+    """Every whitespace-separated term must appear in the item code or description"""
+    for term in text.split():
+        pattern = f'%{_escape_like(term)}%'
+        query = query.filter(db.or_(
+            Product.item_code.ilike(pattern, escape='\\'),
+            Product.description.ilike(pattern, escape='\\')
+        ))
+    return query
+
+@bp.route('/suppliers/<int:id>')
+@login_required
+def supplier_detail(id):
+    supplier = Supplier.query.get_or_404(id)
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', 50, type=int)
+    sort_by = request.args.get('sort', '')
+    search = request.args.get('q', '').strip()
+    
+    # Only this supplier's products are loaded, sorted and paginated in SQL;
+    # the link picker fetches candidates from /suppliers/<id>/products/picker
+    query = db.session.query(Product, supplier_products.c.supplier_price).join(
+        supplier_products, supplier_products.c.product_id == Product.id
+    ).filter(supplier_products.c.supplier_id == id)
+    if search:
+        query = _product_term_filter(query, search)
+    
+    pagination = query.order_by(*_stock_sort_order(sort_by), Product.item_code).paginate(
+        page=page,
+        per_page=per_page,
+        error_out=False
+    )
+    product_count = db.session.query(func.count()).select_from(supplier_products).filter(
+        supplier_products.c.supplier_id == id
+    ).scalar()
+    
+    return render_template('supplier_detail.html', 
+                         supplier=supplier, 
+                         products=pagination.items,
+                         pagination=pagination,
+                         total_pages=pagination.pages,
+                         current_page=page,
+                         product_count=product_count,
+                         sort_by=sort_by,
+                         search=search,
+                         low_stock=SUPPLIER_LOW_STOCK,
+                         medium_stock=SUPPLIER_MEDIUM_STOCK)
+
+@bp.route('/suppliers/<int:id>/products/picker')
+@login_required
+def supplier_product_picker(id):
+    """Search the catalogue for the link-products picker, flagging products already linked"""
+    Supplier.query.get_or_404(id)
+    page = max(request.args.get('page', 1, type=int), 1)
+    search = request.args.get('q', '').strip()
+    
+    linked = db.session.query(supplier_products.c.product_id).filter(
+        supplier_products.c.supplier_id == id
+    ).subquery()
+    query = db.session.query(
+        Product.id, Product.item_code, Product.description, Product.uom, Product.price, Product.stock,
+        linked.c.product_id.isnot(None).label('linked')
+    ).outerjoin(linked, linked.c.product_id == Product.id)
+    if search:
+        query = _product_term_filter(query, search)
+    
+    rows = query.order_by(Product.item_code).offset((page - 1) * SUPPLIER_PICKER_PAGE_SIZE).limit(SUPPLIER_PICKER_PAGE_SIZE + 1).all()
+    return jsonify({
+        'success': True,
+        'products': [{
+            'id': row.id,
+            'item_code': row.item_code,
+            'description': row.description,
+            'uom': row.uom,
+            'price': row.price,
+            'stock': row.stock,
+            'linked': bool(row.linked)
+        } for row in rows[:SUPPLIER_PICKER_PAGE_SIZE]],
+        'has_more': len(rows) > SUPPLIER_PICKER_PAGE_SIZE
+    })
+
+@bp.route('/suppliers/<int:id>', methods=['PUT'])
+@login_required
+def update_supplier(id):
+    supplier = Supplier.query.get_or_404(id)
+    data = request.json
+    
+    # Server-side validation
+    if not data.get('name'):
+        return jsonify({'success': False, 'error': 'Name is required'})
+    
+    try:
+        supplier.name = data['name']
+        supplier.phone = data.get('phone')
+        supplier.email = data.get('email')
+        supplier.address = data.get('address')
+        
+        db.session.commit()
+        return jsonify({'success': True})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
+@bp.route('/suppliers/<int:id>/products', methods=['POST'])
+@login_required
+def link_supplier_products(id):
+    supplier = Supplier.query.get_or_404(id)
+    data = request.json
+    
+    try:
+        # Links are added to the existing ones; the picker only shows a page of products at a time
+        requested = {int(product_id) for product_id in data.get('product_ids', [])}
+        linked_count = link_products_to_supplier(supplier.id, Product.id.in_(requested)) if requested else 0
+        
+        db.session.commit()
+        return jsonify({'success': True, 'linked_count': linked_count})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
+@bp.route('/suppliers/<int:id>/products', methods=['DELETE'])
+@login_required
+def unlink_supplier_products(id):
+    Supplier.query.get_or_404(id)
+    data = request.json or {}
+    product_ids = [int(product_id) for product_id in data.get('product_ids', [])]
+    if not product_ids:
+        return jsonify({'success': False, 'error': 'No products selected'})
+    
+    try:
+        result = db.session.execute(
+            supplier_products.delete().where(
+                supplier_products.c.supplier_id == id,
+                supplier_products.c.product_id.in_(product_ids)
+            )
+        )
+        db.session.commit()
+        return jsonify({'success': True, 'unlinked_count': result.rowcount})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
+@bp.route('/suppliers/<int:id>', methods=['DELETE'])
+@login_required
+def delete_supplier(id):
+    supplier = Supplier.query.get_or_404(id)
+    # Draft and cancelled orders go with the supplier; anything that was sent or
+    # received is history that has to be kept.
+    kept_orders = PurchaseOrder.query.filter(
+        PurchaseOrder.supplier_id == id,
+        PurchaseOrder.status.in_(('ordered', 'received'))
+    ).count()
+    if kept_orders:
+        return jsonify({'success': False, 'error': 'Supplier has ordered or received purchase orders and cannot be deleted'}), 400
+    try:
+        for order in PurchaseOrder.query.filter_by(supplier_id=id).all():
+            db.session.delete(order)
+        db.session.delete(supplier)
+        db.session.commit()
+        return jsonify({'success': True})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
+@bp.route('/suppliers/<int:id>/products/import', methods=['POST'])
+@login_required
+def import_supplier_products(id):
+    """Link products by item code, optionally with the supplier's prices.
+    
+    Accepts {"products": [{"item_code": ..., "price": ...}, ...]} for price
+    lists, or the older {"product_codes": [...]}.
+    """
+    supplier = Supplier.query.get_or_404(id)
+    data = request.json
+    
+    if not data or not ('products' in data or 'product_codes' in data):
+        return jsonify({'success': False, 'error': 'No product codes provided'})
+    
+    try:
+        entries = []
+        for entry in data.get('products') or [{'item_code': code} for code in data.get('product_codes') or []]:
+            item_code = _text(entry.get('item_code'))
+            if not item_code:
+                continue
+            price = entry.get('price')
+            price = float(str(price).replace(',', '')) if _text(price) else None
+            entries.append((item_code, price))
+    except (TypeError, ValueError, AttributeError) as e:
+        return jsonify({'success': False, 'error': f'Invalid price list: {str(e)}'})
+    if not entries:
+        return jsonify({'success': False, 'error': 'No product codes provided'}), 400
+    
+    try:
+        matched, unknown = import_supplier_price_list(supplier.id, entries)
+        db.session.commit()
+        
+        return jsonify({
+            'success': True,
+            'message': f'Successfully linked {matched} products to supplier',
+            'matched_count': matched,
+            'unknown_count': len(unknown),
+            'unknown_codes': unknown[:100]
+        })
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
+@bp.route('/suppliers/<int:id>/products/export')
+@login_required
+def export_supplier_products(id):
+    import pandas as pd
+    
+    supplier = Supplier.query.get_or_404(id)
+    products = db.session.query(Product, supplier_products.c.supplier_price).join(
+        supplier_products, supplier_products.c.product_id == Product.id
+    ).filter(supplier_products.c.supplier_id == id).order_by(Product.item_code).all()
+    
+    # Create DataFrame with supplier's products
+    df = pd.DataFrame([{
+        'Item Code': p.item_code,
+        'Description': p.description,
+        'Tamil Name': p.tamil_name,
+        'UOM': p.uom,
+        'Price': p.price,
+        'Stock': p.stock,
+        'Restock Level': p.restock_level,
+        'Stock Locations': p.stock_locations,
+        'Tags': p.tags,
+        'Notes': p.notes,
+        'Supplier Price': supplier_price
+    } for p, supplier_price in products])
+
+    output = io.BytesIO()
+    writer = pd.ExcelWriter(output, engine='xlsxwriter')
+    workbook = writer.book
+    
+    # Add formats
+    header_format = workbook.add_format({
+        'bold': True,
+        'text_wrap': True,
+        'valign': 'top',
+        'bg_color': '#D9D9D9',
+        'border': 1
+    })
+    
+    # Write DataFrame to Excel
+    df.to_excel(writer, sheet_name='Products', index=False)
+    
+    # Get the worksheet object
+    worksheet = writer.sheets['Products']
+    
+    # Format the header row
+    for col_num, value in enumerate(df.columns.values):
+        worksheet.write(0, col_num, value, header_format)
+        worksheet.set_column(col_num, col_num, 15)  # Set column width
+    
+    # Set specific column widths
+    worksheet.set_column('B:B', 30)  # Description column
+    worksheet.set_column('C:C', 20)  # Tamil Name column
+    worksheet.set_column('H:H', 25)  # Stock Locations column
+    worksheet.set_column('I:I', 20)  # Tags column
+    worksheet.set_column('J:J', 30)  # Notes column
+    
+    writer.close()
+    output.seek(0)
+
+    return send_file(
+        output,
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        as_attachment=True,
+        download_name=f'{supplier.name}_products.xlsx'
+    )
+
+REORDER_TARGET_MULTIPLIER = 2  # Reorder up to this many times the restock level
+OPEN_PO_STATUSES = ('draft', 'ordered')
+
+def generate_reorder_drafts():
+    """Create draft purchase orders for every product at or below its restock level.
+    
+    One query finds the products, subtracts quantities already on open POs and
+    picks each product's supplier (cheapest known supplier price, then lowest
+    supplier id). One draft PO is created per supplier and all lines are bulk
+    inserted. Returns a summary dict; the caller commits.
+    """
+    on_order = db.session.query(
+        PurchaseOrderItem.product_id,
+        func.sum(PurchaseOrderItem.quantity).label('quantity')
+    ).join(PurchaseOrder).filter(PurchaseOrder.status.in_(OPEN_PO_STATUSES)).group_by(PurchaseOrderItem.product_id).subquery()
+    
+    stock = func.coalesce(Product.stock, 0)
+    suggested = Product.restock_level * REORDER_TARGET_MULTIPLIER - stock - func.coalesce(on_order.c.quantity, 0)
+    candidates = db.session.query(
+        Product.id.label('product_id'),
+        supplier_products.c.supplier_id,
+        supplier_products.c.supplier_price,
+        suggested.label('suggested'),
+        func.row_number().over(
+            partition_by=Product.id,
+            order_by=(supplier_products.c.supplier_price.is_(None), supplier_products.c.supplier_price, supplier_products.c.supplier_id)
+        ).label('supplier_rank')
+    ).outerjoin(supplier_products, supplier_products.c.product_id == Product.id).outerjoin(
+        on_order, on_order.c.product_id == Product.id
+    ).filter(
+        Product.restock_level > 0,
+        stock <= Product.restock_level,
+        suggested > 0
+    ).subquery()
+    
+    rows = db.session.query(candidates).filter(candidates.c.supplier_rank == 1).all()
+    
+    by_supplier = {}
+    unassigned = 0
+    for row in rows:
+        if row.supplier_id is None:
+            unassigned += 1
+            continue
+        by_supplier.setdefault(row.supplier_id, []).append(row)
+    
+    orders = {supplier_id: PurchaseOrder(supplier_id=supplier_id, status='draft', notes='Generated from restock levels')
+              for supplier_id in by_supplier}
+    db.session.add_all(orders.values())
+    db.session.flush()
+    
+    if by_supplier:
+        db.session.execute(db.insert(PurchaseOrderItem), [
+            {
+                'purchase_order_id': orders[supplier_id].id,
+                'product_id': row.product_id,
+                'quantity': int(row.suggested),
+                'unit_price': row.supplier_price
+            }
+            for supplier_id, supplier_rows in by_supplier.items() for row in supplier_rows
+        ])
+    
+    return {
+        'purchase_orders': [order.id for order in orders.values()],
+        'products': sum(len(supplier_rows) for supplier_rows in by_supplier.values()),
+        'products_without_supplier': unassigned
+    }
+
+@bp.cli.command('generate-reorders')
+def generate_reorders_command():
+    """Draft purchase orders for products below their restock level (run from cron)"""
+    summary = generate_reorder_drafts()
+    db.session.commit()
+    print(f"Drafted {len(summary['purchase_orders'])} purchase orders covering {summary['products']} products")
+    if summary['products_without_supplier']:
+        print(f"{summary['products_without_supplier']} products need restocking but have no supplier")
+
+def _purchase_order_summaries(*criteria):
+    """Purchase orders with supplier name, line count and value from one grouped query"""
+    return db.session.query(
+        PurchaseOrder,
+        Supplier.name.label('supplier_name'),
+        func.count(PurchaseOrderItem.id).label('line_count'),
+        func.sum(PurchaseOrderItem.quantity * func.coalesce(PurchaseOrderItem.unit_price, 0)).label('total_value')
+    ).join(Supplier, Supplier.id == PurchaseOrder.supplier_id).outerjoin(
+        PurchaseOrderItem, PurchaseOrderItem.purchase_order_id == PurchaseOrder.id
+    ).filter(*criteria).group_by(PurchaseOrder.id, Supplier.name).order_by(PurchaseOrder.created_at.desc(), PurchaseOrder.id.desc())
+
+@bp.route('/purchase-orders')
+@login_required
+@permission_required('manage_stock')
+def purchase_orders():
+    status = request.args.get('status', '')
+    page = request.args.get('page', 1, type=int)
+    criteria = [PurchaseOrder.status == status] if status else []
+    pagination = _purchase_order_summaries(*criteria).paginate(page=page, per_page=50, error_out=False)
+    return render_template('purchase_orders.html',
+                           orders=pagination.items,
+                           pagination=pagination,
+                           total_pages=pagination.pages,
+                           current_page=page,
+                           status=status)
+
+@bp.route('/purchase-orders/generate', methods=['POST'])
+@login_required
+@permission_required('manage_stock')
+def generate_purchase_orders():
+    try:
+        summary = generate_reorder_drafts()
+        db.session.commit()
+        return jsonify({'success': True, **summary})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
+@bp.route('/purchase-orders/<int:id>')
+@login_required
+@permission_required('manage_stock')
+def purchase_order_detail(id):
+    order = PurchaseOrder.query.get_or_404(id)
+    items = db.session.query(
+        PurchaseOrderItem.id, PurchaseOrderItem.product_id, PurchaseOrderItem.quantity,
+        PurchaseOrderItem.received_quantity, PurchaseOrderItem.unit_price,
+        Product.item_code, Product.description, Product.uom, Product.stock, Product.restock_level
+    ).outerjoin(Product, Product.id == PurchaseOrderItem.product_id).filter(
+        PurchaseOrderItem.purchase_order_id == id
+    ).order_by(Product.item_code).all()
+    return jsonify({
+        'success': True,
+        'id': order.id,
+        'supplier_id': order.supplier_id,
+        'supplier_name': order.supplier.name,
+        'status': order.status,
+        'notes': order.notes,
+        'created_at': order.created_at.strftime('%Y-%m-%d %H:%M'),
+        'received_at': order.received_at.strftime('%Y-%m-%d %H:%M') if order.received_at else None,
+        'items': [dict(item._mapping) for item in items]
+    })
+
+@bp.route('/purchase-orders/<int:id>', methods=['PUT', 'DELETE'])
+@login_required
+@permission_required('manage_stock')
+def update_purchase_order(id):
+    order = PurchaseOrder.query.get_or_404(id)
+    
+    if request.method == 'DELETE':
+        if order.status not in ('draft', 'cancelled'):
+            return jsonify({'success': False, 'error': 'Only draft or cancelled orders can be deleted'})
+        try:
+            db.session.delete(order)
+            db.session.commit()
+            return jsonify({'success': True})
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': str(e)})
+    
+    data = request.json or {}
+    status = data.get('status', order.status)
+    allowed = {'draft': ('draft', 'ordered', 'cancelled'), 'ordered': ('ordered', 'cancelled')}
+    if status not in allowed.get(order.status, ()):
+        return jsonify({'success': False, 'error': f'Cannot change a {order.status} order to {status}'})
+    
+    try:
+        # Quantities can only be edited while the order is a draft; a quantity of 0 drops the line
+        quantities = {int(item['id']): int(item['quantity']) for item in data.get('items', [])}
+        if quantities and order.status != 'draft':
+            return jsonify({'success': False, 'error': 'Only draft orders can be edited'})
+        if quantities:
+            own_ids = {row.id for row in db.session.query(PurchaseOrderItem.id).filter(PurchaseOrderItem.purchase_order_id == id)}
+            foreign = sorted(set(quantities) - own_ids)
+            if foreign:
+                return jsonify({'success': False, 'error': f'Items not on this order: {foreign}'}), 400
+            db.session.execute(
+                db.delete(PurchaseOrderItem).where(
+                    PurchaseOrderItem.purchase_order_id == id,
+                    PurchaseOrderItem.id.in_([item_id for item_id, quantity in quantities.items() if quantity <= 0])
+                )
+            )
+            kept = [{'id': item_id, 'quantity': quantity} for item_id, quantity in quantities.items() if quantity > 0]
+            if kept:
+                db.session.execute(db.update(PurchaseOrderItem), kept)
+        
+        order.status = status
+        if 'notes' in data:
+            order.notes = data['notes']
+        db.session.commit()
+        return jsonify({'success': True})
+    except (KeyError, TypeError, ValueError) as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': f'Invalid items: {str(e)}'})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
+@bp.route('/purchase-orders/<int:id>/receive', methods=['POST'])
+@login_required
+@permission_required('manage_stock')
+def receive_purchase_order(id):
+    """Receive an order: record received quantities and add them to stock in one UPDATE.
+    
+    Lines not listed in {"items": [{"id": ..., "received_quantity": ...}]} are
+    received in full.
+    """
+    order = PurchaseOrder.query.get_or_404(id)
+    if order.status not in OPEN_PO_STATUSES:
+        return jsonify({'success': False, 'error': f'Cannot receive a {order.status} order'})
+    
+    data = request.json or {}
+    try:
+        received = {int(item['id']): int(item['received_quantity']) for item in data.get('items', [])}
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': f'Invalid items: {str(e)}'})
+    if any(quantity < 0 for quantity in received.values()):
+        return jsonify({'success': False, 'error': 'Received quantities cannot be negative'})
+    
+    try:
+        # Claim the order in the same statement that checks it is still open, so two
+        # concurrent receipts can't both add the stock
+        claimed = db.session.execute(
+            db.update(PurchaseOrder)
+            .where(PurchaseOrder.id == id, PurchaseOrder.status.in_(OPEN_PO_STATUSES))
+            .values(status='received', received_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not claimed:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': 'Order was already received or cancelled'}), 409
+        
+        lines = db.session.query(PurchaseOrderItem.id, PurchaseOrderItem.product_id, PurchaseOrderItem.quantity).filter(
+            PurchaseOrderItem.purchase_order_id == id
+        ).all()
+        
+        deltas = {}
+        updates = []
+        for line in lines:
+            quantity = received.get(line.id, line.quantity)
+            updates.append({'id': line.id, 'received_quantity': quantity})
+            if line.product_id is not None:  # Lines of deleted products are recorded but add no stock
+                deltas[line.product_id] = deltas.get(line.product_id, 0) + quantity
+        
+        if updates:
+            db.session.execute(db.update(PurchaseOrderItem), updates)
+        _apply_stock_deltas(deltas, 'purchase_receipt', order.id)
+        db.session.commit()
+        return jsonify({'success': True, 'received_lines': len(updates)})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
@@ -0,0 +1,279 @@
+"""Login, user management and 2FA"""
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session
+from werkzeug.security import generate_password_hash, check_password_hash
+import traceback
+from extensions import db, cache
+from models import Permission, User
+from auth import invalidate_permissions, login_required, admin_required, get_current_user, update_session_permissions
+
+bp = Blueprint('users', __name__, cli_group=None)
+
+@bp.route('/login', methods=['GET', 'POST'])
+def login():
+    if request.method == 'POST':
+        try:
+            username = request.form.get('username')
+            password = request.form.get('password')
+            totp_token = request.form.get('totp_token')
+            
+            print(f"Login attempt for user: {username}")
+            
+            user = User.query.filter_by(username=username).first()
+            if not user:
+                print(f"User not found: {username}")
+                flash('Invalid username or password', 'error')
+                return redirect(url_for('users.login'))
+            
+            # Verify password using the same method used for hashing
+            if not check_password_hash(user.password, password):
+                print(f"Invalid password for user: {username}")
+                flash('Invalid username or password', 'error')
+                return redirect(url_for('users.login'))
+            
+            # Check 2FA if enabled
+            if user.totp_enabled:
+                if not totp_token:
+                    flash('2FA token required', 'error')
+                    return redirect(url_for('users.login'))
+                
+                if not user.verify_totp(totp_token):
+                    print(f"Invalid 2FA token for user: {username}")
+                    flash('Invalid 2FA token', 'error')
+                    return redirect(url_for('users.login'))
+            
+            # Login successful
+            session.clear()
+            session['user_id'] = user.id
+            session['logged_in'] = True
+            update_session_permissions(user.id)
+            
+            print(f"Login successful for user: {username}")
+            print(f"User permissions: {session['permissions']}")  # Debug log
+            return redirect(url_for('main.index'))
+            
+        except Exception as e:
+            print(f"Login error for user {username if username else 'unknown'}: {str(e)}")
+            print(f"Full traceback: {traceback.format_exc()}")
+            flash('An error occurred during login. Please try again.', 'error')
+            return redirect(url_for('users.login'))
+    
+    return render_template('login.html')
+
+@bp.route('/logout')
+def logout():
+    session.clear()
+    return redirect(url_for('users.login'))
+
+# Users management routes
+@bp.route('/users')
+@login_required
+@admin_required
+def users():
+    try:
+        current_user = get_current_user()
+        if not current_user:
+            flash('Session expired. Please login again.', 'error')
+            return redirect(url_for('users.login'))
+        
+        if current_user.role != 'admin':
+            flash('Access denied. Admin privileges required.', 'error')
+            return redirect(url_for('main.index'))
+        
+        users = User.query.all()
+        permissions = Permission.query.all()
+        
+        # Group permissions by category for better organization
+        grouped_permissions = {
+            'products': [],
+            'invoices': [],
+            'customers': [],
+            'suppliers': [],
+            'others': []
+        }
+        
+        for perm in permissions:
+            if perm.name.startswith(('view_product', 'edit_product')):
+                grouped_permissions['products'].append(perm)
+            elif 'invoice' in perm.name:
+                grouped_permissions['invoices'].append(perm)
+            elif 'customer' in perm.name:
+                grouped_permissions['customers'].append(perm)
+            elif 'supplier' in perm.name:
+                grouped_permissions['suppliers'].append(perm)
+            else:
+                grouped_permissions['others'].append(perm)
+        
+        return render_template(
+            'users.html',
+            users=users,
+            permissions=permissions,
+            grouped_permissions=grouped_permissions,
+            current_user=current_user
+        )
+    except Exception as e:
+        print(f"Error in users route: {str(e)}")
+        print(f"Full traceback: {traceback.format_exc()}")  # Add full traceback
+        db.session.rollback()
+        flash('An error occurred while loading users. Please try again.', 'error')
+        return redirect(url_for('main.index'))
+
+@bp.route('/users', methods=['POST'])
+@login_required
+@admin_required
+def add_user():
+    try:
+        data = request.get_json()
+        
+        # Validate required fields
+        if not all(key in data for key in ['username', 'password', 'role']):
+            return jsonify({'error': 'Missing required fields'}), 400
+            
+        # Check if username exists
+        if User.query.filter_by(username=data['username']).first():
+            return jsonify({'error': 'Username already exists'}), 400
+        
+        # Create new user
+        new_user = User(
+            username=data['username'],
+            password=generate_password_hash(data['password'], method='pbkdf2:sha256'),
+            role=data['role'],
+            totp_enabled=data.get('totp_enabled', False)
+        )
+        
+        # Handle permissions
+        if data['role'] != 'admin' and 'permissions' in data:
+            try:
+                permissions = Permission.query.filter(Permission.id.in_(data['permissions'])).all()
+                new_user.permissions = permissions
+            except Exception as e:
+                print(f"Error setting permissions: {str(e)}")
+                return jsonify({'error': 'Invalid permissions data'}), 400
+        
+        db.session.add(new_user)
+        db.session.commit()
+        
+        print(f"User created successfully: {new_user.username}")
+        return jsonify({'success': True})
+        
+    except Exception as e:
+        print(f"Error creating user: {str(e)}")
+        print(f"Full traceback: {traceback.format_exc()}")
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/users/<int:id>', methods=['PUT'])
+@login_required
+@admin_required
+def update_user(id):
+    user = User.query.get_or_404(id)
+    data = request.get_json()
+    
+    if data['username'] != user.username and User.query.filter_by(username=data['username']).first():
+        return jsonify({'error': 'Username already exists'}), 400
+    
+    try:
+        user.username = data['username']
+        user.role = data['role']
+        if data.get('password'):
+            user.password = generate_password_hash(data['password'])
+        
+        # Update 2FA status
+        user.totp_enabled = data.get('totp_enabled', False)
+        if not user.totp_enabled:
+            user.totp_secret = None  # Clear TOTP secret if 2FA is disabled
+        
+        # Update permissions if not admin
+        if data['role'] != 'admin':
+            permissions = Permission.query.filter(Permission.id.in_(data.get('permissions', []))).all()
+            user.permissions = permissions
+        else:
+            user.permissions = []  # Clear permissions for admin as they have all permissions
+        
+        invalidate_permissions(user)
+        db.session.commit()
+            
+        return jsonify({'success': True})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/users/<int:id>', methods=['DELETE'])
+@login_required
+@admin_required
+def delete_user(id):
+    if id == session.get('user_id'):
+        return jsonify({'error': 'Cannot delete your own account'}), 400
+    
+    user = User.query.get_or_404(id)
+    try:
+        db.session.delete(user)
+        db.session.commit()
+        cache.delete(f'permission_version_{id}')
+        return jsonify({'success': True})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/users/<int:id>/permissions')
+@login_required
+@admin_required
+def get_user_permissions(id):
+    user = User.query.get_or_404(id)
+    return jsonify({
+        'permissions': [p.id for p in user.permissions]
+    })
+
+@bp.route('/users/generate-2fa', methods=['POST'])
+@login_required
+@admin_required
+def generate_2fa():
+    from pyotp import random_base32, TOTP
+    
+    data = request.get_json()
+    username = data.get('username')
+    if not username:
+        return jsonify({'success': False, 'error': 'Username is required'})
+    
+    # Generate new TOTP secret
+    totp_secret = random_base32()
+    totp = TOTP(totp_secret)
+    
+    # Generate TOTP URI for QR code
+    totp_uri = f'otpauth://totp/Inventory:{username}?secret={totp_secret}&issuer=Inventory'
+    
+    return jsonify({
+        'success': True,
+        'totp_secret': totp_secret,
+        'totp_uri': totp_uri
+    })
+
+@bp.route('/users/<int:id>/generate-2fa', methods=['POST'])
+@login_required
+@admin_required
+def generate_user_2fa(id):
+    from pyotp import random_base32, TOTP
+    
+    user = User.query.get_or_404(id)
+    data = request.get_json()
+    username = data.get('username', user.username)
+    
+    # Generate new TOTP secret
+    totp_secret = random_base32()
+    totp = TOTP(totp_secret)
+    
+    # Save the TOTP secret to the user
+    try:
+        user.totp_secret = totp_secret
+        db.session.commit()
+        
+        # Generate TOTP URI for QR code
+        totp_uri = f'otpauth://totp/Inventory:{username}?secret={totp_secret}&issuer=Inventory'
+        
+        return jsonify({
+            'success': True,
+            'totp_secret': totp_secret,
+            'totp_uri': totp_uri
+        })
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
@@ -0,0 +1,92 @@
+"""Extension objects shared by the models and blueprints; bound to the app in create_app()"""
+from flask import current_app
+from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+from datetime import datetime, timedelta
+from functools import wraps
+import os
+
+db = SQLAlchemy()
+migrate = Migrate()
+
+# Connection pool counters for this worker process, updated by pool events
+pool_stats = {'connects': 0, 'checkouts': 0, 'overflow_checkouts': 0, 'invalidated': 0, 'peak_checked_out': 0}
+
+def track_pool(engine):
+    """Count connects, checkouts and invalidations on the engine's pool into pool_stats"""
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        pool_stats['connects'] += 1
+
+    @event.listens_for(engine, 'checkout')
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        pool_stats['checkouts'] += 1
+        # engine.pool, not a captured pool: dispose() swaps in a new one after a fork
+        pool = engine.pool
+        if isinstance(pool, QueuePool):
+            checked_out = pool.checkedout()
+            pool_stats['peak_checked_out'] = max(pool_stats['peak_checked_out'], checked_out)
+            if checked_out > pool.size():
+                pool_stats['overflow_checkouts'] += 1
+
+    @event.listens_for(engine, 'invalidate')
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        pool_stats['invalidated'] += 1
+
+def pool_usage(engine):
+    """Current pool occupancy plus the counters from track_pool(), for this worker (needs an app context)"""
+    pool = engine.pool
+    usage = {'pid': os.getpid(), 'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        usage.update({
+            'size': pool.size(),
+            'max_overflow': current_app.config['SQLALCHEMY_ENGINE_OPTIONS']['max_overflow'],
+            'checked_out': pool.checkedout(),
+            'checked_in': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0)
+        })
+    usage.update(pool_stats)
+    return usage
+
+# Cache decorators
+def cache_for(seconds):
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            cache_key = f.__name__ + str(args) + str(kwargs)
+            cached_result = cache.get(cache_key)
+            if cached_result is not None:
+                return cached_result
+            result = f(*args, **kwargs)
+            cache.set(cache_key, result, timeout=seconds)
+            return result
+        return decorated_function
+    return decorator
+
+# Simple in-memory cache
+class SimpleCache:
+    def __init__(self):
+        self._cache = {}
+        
+    def get(self, key):
+        if key in self._cache:
+            item = self._cache[key]
+            if item['expires'] > datetime.utcnow():
+                return item['value']
+            else:
+                del self._cache[key]
+        return None
+        
+    def set(self, key, value, timeout=300):
+        self._cache[key] = {
+            'value': value,
+            'expires': datetime.utcnow() + timedelta(seconds=timeout)
+        }
+        
+    def delete(self, key):
+        if key in self._cache:
+            del self._cache[key]
+
+cache = SimpleCache()
@@ -1,4 +1,8 @@
-from app import app, db, User, Permission
+from app import create_app
+from extensions import db
+from models import User, Permission
+
+app = create_app(register_blueprints=False)
 
 def fix_user_permissions():
     with app.app_context():
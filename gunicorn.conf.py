@@ -4,4 +4,30 @@ bind = "0.0.0.0:$PORT"
 timeout = 120
 keepalive = 5
 max_requests = 1200
-max_requests_jitter = 50 
\ No newline at end of file
+max_requests_jitter = 50
+
+if worker_class == 'gevent':
+    # preload_app imports the app in the master, so patch before anything else loads.
+    # psycogreen makes psycopg2 wait on the socket through gevent, letting other
+    # greenlets run during a slow query instead of blocking the whole worker.
+    from gevent import monkey
+    monkey.patch_all()
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
+
+# Load the app once in the master so workers fork it already warmed, copy-on-write
+preload_app = True
+
+def post_fork(server, worker):
+    # Never share a database connection the master may have opened with a worker
+    from wsgi import app
+    from extensions import db
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+def worker_exit(server, worker):
+    # Pool counters for this worker, logged when max_requests recycles it
+    from wsgi import app
+    from extensions import db, pool_usage
+    with app.app_context():
+        print(f"Worker {worker.pid} database pool: {pool_usage(db.engine)}")
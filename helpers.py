@@ -0,0 +1,14 @@
+"""Small parsing helpers shared by the blueprints"""
+
+def _escape_like(text):
+    """Escape LIKE wildcards so user input only matches literally (use with escape='\\')"""
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def _text(value):
+    """Cell or JSON value as stripped text, with blanks (and pandas NaN) as None"""
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)  # Phone numbers and references read from Excel come back as floats
+    value = str(value).strip()
+    return value or None
@@ -0,0 +1,66 @@
+"""Report what importing the app costs, using python -X importtime.
+
+    python importtime_report.py                 # slowest imports under wsgi (the app with all blueprints)
+    python importtime_report.py --top 40        # show more of them
+    python importtime_report.py --budget 800    # exit 1 if a cold import takes over 800 ms
+
+It also fails if one of the lazily imported heavy libraries (LAZY_MODULES) is
+pulled in at import time again. Run it from a deploy check or before pushing.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+# Libraries only imported inside the routes that need them
+LAZY_MODULES = ('pandas', 'openpyxl', 'xlrd', 'reportlab', 'psycopg2', 'pyotp', 'invoice_pdf')
+
+def measure(module='wsgi'):
+    """Import module in a fresh interpreter and return [(name, depth, self_us, cumulative_us)]"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=os.path.abspath(os.path.dirname(__file__)),
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        sys.exit(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip(' '))) // 2
+        rows.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description='Report cold import time of the app')
+    parser.add_argument('--module', default='wsgi', help='Module to import (default: wsgi)')
+    parser.add_argument('--top', type=int, default=20, help='Number of direct imports to list')
+    parser.add_argument('--budget', type=float, help='Fail if the import takes longer than this many milliseconds')
+    args = parser.parse_args()
+
+    rows = measure(args.module)
+    total_us = next(cumulative for name, depth, _, cumulative in rows if name == args.module and depth == 0)
+
+    # Direct imports of the module are one level below it
+    direct = sorted((row for row in rows if row[1] == 1), key=lambda row: row[3], reverse=True)
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for name, _, self_us, cumulative_us in direct[:args.top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
+    print(f"\nimport {args.module}: {total_us / 1000:.1f} ms, {len(rows)} modules")
+
+    failed = False
+    eager = sorted({name for name, _, _, _ in rows if name.split('.')[0] in LAZY_MODULES and '.' not in name})
+    if eager:
+        print(f"FAIL: imported at startup but meant to be lazy: {', '.join(eager)}")
+        failed = True
+    if args.budget is not None and total_us / 1000 > args.budget:
+        print(f"FAIL: {total_us / 1000:.1f} ms is over the {args.budget:.0f} ms budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
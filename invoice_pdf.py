@@ -0,0 +1,307 @@
+"""Server-side PDF rendering for invoices and customer statements.
+
+The renderers work on plain dicts (see ``_invoice_print_payloads`` in
+blueprints/invoices.py and ``_ledger_entry`` in blueprints/customers.py) so they
+never touch the database and can run inside worker processes without importing
+the web app. Fonts and styles are set up once per process.
+"""
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_RIGHT
+from reportlab.lib.pagesizes import A4, A5
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import cm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import PageBreak, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+ITEMS_PER_PAGE = 26  # Same pagination as print_invoice.html
+BATCH_CHUNK_SIZE = 25  # Invoices rendered per worker task in batch mode
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+DEFAULT_TAMIL_FONT = os.path.join(BASE_DIR, 'static', 'fonts', 'NotoSansTamil-Regular.ttf')
+
+LABELS = {
+    'en': {
+        'title': 'Estimate',
+        'to': 'To:',
+        'no': 'No:',
+        'date': 'Date:',
+        'columns': ['S.No', 'Description', 'UOM', 'Qty', 'Price', 'Amount'],
+        'previous_total': 'Previous Page Total',
+        'page_total': 'Page Total',
+        'grand_total': 'Grand Total:',
+        'page': 'Page {page} of {pages}',
+    },
+    'ta': {
+        'title': 'ESTIMATE',
+        'to': 'To:',
+        'no': 'No:',
+        'date': 'தேதி:',
+        'columns': ['வ.எண்', 'விவரம்', 'அலகு', 'அளவு', 'விலை', 'தொகை'],
+        'previous_total': 'Previous Page Total',
+        'page_total': 'Page Total',
+        'grand_total': 'மொத்தம்:',
+        'page': 'பக்கம் {page} / {pages}',
+    },
+}
+
+COLUMN_WIDTHS = [0.05, 0.45, 0.10, 0.12, 0.13, 0.15]
+STATEMENT_COLUMNS = ['Date', 'Particulars', 'Debit', 'Credit', 'Balance']
+STATEMENT_COLUMN_WIDTHS = [0.16, 0.45, 0.13, 0.13, 0.13]
+
+
+class FontNotFoundError(Exception):
+    """The Tamil font isn't installed, so Tamil PDFs can't be rendered"""
+
+
+@lru_cache(maxsize=None)
+def _fonts(lang):
+    """Register fonts once per process and return (regular, bold, lang)"""
+    if lang == 'ta':
+        font_path = os.getenv('TAMIL_FONT_PATH', DEFAULT_TAMIL_FONT)
+        if not os.path.exists(font_path):
+            # Without a Tamil font the glyphs would print as boxes
+            raise FontNotFoundError(f"Tamil font not found at {font_path}; install NotoSansTamil-Regular.ttf there or set TAMIL_FONT_PATH")
+        pdfmetrics.registerFont(TTFont('Tamil', font_path))
+        pdfmetrics.registerFontFamily('Tamil', normal='Tamil', bold='Tamil', italic='Tamil', boldItalic='Tamil')
+        return 'Tamil', 'Tamil', 'ta'
+    return 'Helvetica', 'Helvetica-Bold', 'en'
+
+
+@lru_cache(maxsize=None)
+def _styles(lang):
+    """Build paragraph and table styles once per process"""
+    regular, bold, lang = _fonts(lang)
+    return {
+        'lang': lang,
+        'labels': LABELS[lang],
+        'title': ParagraphStyle('title', fontName=bold, fontSize=12, leading=15, alignment=TA_CENTER),
+        'info': ParagraphStyle('info', fontName=regular, fontSize=9, leading=11),
+        'info_center': ParagraphStyle('info_center', fontName=regular, fontSize=9, leading=11, alignment=TA_CENTER),
+        'info_right': ParagraphStyle('info_right', fontName=regular, fontSize=9, leading=11, alignment=TA_RIGHT),
+        'grand_total': ParagraphStyle('grand_total', fontName=bold, fontSize=14, leading=17, alignment=TA_RIGHT),
+        'page_number': ParagraphStyle('page_number', fontName=regular, fontSize=8, leading=10, alignment=TA_CENTER),
+        'table': [
+            ('FONTNAME', (0, 0), (-1, -1), regular),
+            ('FONTNAME', (0, 0), (-1, 0), bold),
+            ('FONTSIZE', (0, 0), (-1, -1), 8),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#f5f5f5')),
+            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+            ('ALIGN', (0, 1), (0, -1), 'CENTER'),
+            ('ALIGN', (2, 1), (2, -1), 'CENTER'),
+            ('ALIGN', (3, 1), (-1, -1), 'RIGHT'),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ],
+    }
+
+
+def payload_version(payload):
+    """Content version of an invoice payload, used as the render cache key"""
+    return hashlib.sha1(repr(payload).encode('utf-8')).hexdigest()
+
+
+def _invoice_story(payload, styles, width):
+    """Flowables for one invoice, one logical page per ITEMS_PER_PAGE lines"""
+    labels = styles['labels']
+    items = payload['items']
+    total_pages = max(1, (len(items) + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE)
+    col_widths = [width * w for w in COLUMN_WIDTHS]
+    story = []
+    prev_total = 0
+
+    for page in range(total_pages):
+        page_items = items[page * ITEMS_PER_PAGE:(page + 1) * ITEMS_PER_PAGE]
+        page_total = prev_total + sum(item['amount'] for item in page_items)
+
+        if page == 0:
+            story.append(Paragraph(labels['title'], styles['title']))
+            story.append(Spacer(1, 0.2 * cm))
+            info = Table([[
+                Paragraph(f"<b>{labels['to']}</b> {_escape(payload['customer_name'])}", styles['info']),
+                Paragraph(f"<b>{labels['no']}</b> {payload['order_number']}", styles['info_center']),
+                Paragraph(f"<b>{labels['date']}</b> {payload['date'].strftime('%d-%m-%Y')}", styles['info_right']),
+            ]], colWidths=[width * 0.4, width * 0.3, width * 0.3])
+            info.setStyle(TableStyle([('LINEBELOW', (0, 0), (-1, -1), 1, colors.black)]))
+            story.append(info)
+            story.append(Spacer(1, 0.2 * cm))
+
+        rows = [labels['columns']]
+        extra_styles = []
+        if page > 0:
+            rows.append([labels['previous_total'], '', '', '', '', f'{prev_total:.3f}'])
+            extra_styles.extend(_total_row_style(1))
+        for index, item in enumerate(page_items, start=page * ITEMS_PER_PAGE + 1):
+            description = item['description']
+            if styles['lang'] == 'ta':
+                description = item['tamil_name'] or description
+            rows.append([
+                str(index),
+                description,
+                item['uom'],
+                f"{item['quantity']:.3f}",
+                f"{item['price']:.2f}",
+                f"{item['amount']:.3f}",
+            ])
+        rows.extend([''] * 6 for _ in range(ITEMS_PER_PAGE - len(page_items)))
+        if total_pages > 1:
+            rows.append([labels['page_total'], '', '', '', '', f'{page_total:.3f}'])
+            extra_styles.extend(_total_row_style(len(rows) - 1))
+
+        table = Table(rows, colWidths=col_widths, rowHeights=[0.7 * cm] + [0.5 * cm] * (len(rows) - 1))
+        table.setStyle(TableStyle(styles['table'] + extra_styles))
+        story.append(table)
+
+        if page == total_pages - 1:
+            story.append(Spacer(1, 0.3 * cm))
+            story.append(Paragraph(
+                f"{labels['grand_total']} {round(payload['total_amount'] or 0):.0f}",
+                styles['grand_total']
+            ))
+        story.append(Spacer(1, 0.2 * cm))
+        story.append(Paragraph(labels['page'].format(page=page + 1, pages=total_pages), styles['page_number']))
+        story.append(PageBreak())
+        prev_total = page_total
+
+    return story
+
+
+def _total_row_style(row):
+    _, bold, _ = _fonts('en')
+    return [
+        ('SPAN', (0, row), (4, row)),
+        ('ALIGN', (0, row), (-1, row), 'RIGHT'),
+        ('FONTNAME', (0, row), (-1, row), bold),
+    ]
+
+
+def _escape(text):
+    return (text or '').replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def render_invoices_pdf(payloads, lang='en'):
+    """Render one or more invoices into a single PDF and return its bytes"""
+    styles = _styles(lang)
+    output = BytesIO()
+    doc = SimpleDocTemplate(
+        output,
+        pagesize=A5,
+        leftMargin=0.6 * cm,
+        rightMargin=0.6 * cm,
+        topMargin=0.6 * cm,
+        bottomMargin=0.6 * cm,
+    )
+    story = []
+    for payload in payloads:
+        story.extend(_invoice_story(payload, styles, doc.width))
+    if story:
+        story.pop()  # Drop the trailing page break
+    doc.build(story)
+    return output.getvalue()
+
+
+def render_invoice_pdf(payload, lang='en'):
+    return render_invoices_pdf([payload], lang)
+
+
+def _warm_worker(lang):
+    _styles(lang)
+
+
+def render_batch_pdf(payloads, lang='en', processes=None):
+    """Render many invoices into one PDF, spreading chunks over a process pool"""
+    if len(payloads) <= BATCH_CHUNK_SIZE:
+        return render_invoices_pdf(payloads, lang)
+
+    from pypdf import PdfWriter  # Only batch mode needs to merge documents
+
+    # Fail here on a missing font; raised in a worker initializer it would only
+    # surface as a BrokenProcessPool
+    _styles(lang)
+
+    chunks = [payloads[i:i + BATCH_CHUNK_SIZE] for i in range(0, len(payloads), BATCH_CHUNK_SIZE)]
+    processes = min(processes or os.cpu_count() or 1, len(chunks))
+
+    # Spawn rather than fork so workers don't inherit gevent state or DB sockets
+    with ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_warm_worker,
+        initargs=(lang,)
+    ) as pool:
+        parts = list(pool.map(render_invoices_pdf, chunks, [lang] * len(chunks)))
+
+    writer = PdfWriter()
+    for part in parts:
+        writer.append(BytesIO(part))
+    output = BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def _statement_particulars(entry):
+    if entry['entry_type'] == 'receivable':
+        text = f"Invoice #{entry['invoice_number']}" if entry['invoice_number'] else 'Receivable'
+    else:
+        text = entry['entry_type'].title()
+        if entry['payment_method']:
+            text += f" ({entry['payment_method']})"
+        if entry['reference_number']:
+            text += f" Ref {entry['reference_number']}"
+    if entry['notes']:
+        text += f" - {entry['notes']}"
+    return text
+
+
+def render_statement_pdf(customer_name, start_date, end_date, opening_balance, entries):
+    """Render a customer statement (ledger entries with running balance) and return its bytes"""
+    styles = _styles('en')
+    output = BytesIO()
+    doc = SimpleDocTemplate(
+        output,
+        pagesize=A4,
+        leftMargin=1 * cm,
+        rightMargin=1 * cm,
+        topMargin=1 * cm,
+        bottomMargin=1 * cm,
+        title=f'Statement - {customer_name}',
+    )
+    period = f"{start_date or 'Beginning'} to {end_date or 'Today'}"
+    story = [
+        Paragraph('Statement of Account', styles['title']),
+        Spacer(1, 0.2 * cm),
+        Paragraph(f"<b>Customer:</b> {_escape(customer_name)}", styles['info']),
+        Paragraph(f"<b>Period:</b> {period}", styles['info']),
+        Spacer(1, 0.3 * cm),
+    ]
+
+    cell = ParagraphStyle('statement_cell', parent=styles['info'], fontSize=8, leading=10)
+    rows = [STATEMENT_COLUMNS, ['', 'Opening balance', '', '', f'{opening_balance:.2f}']]
+    for entry in entries:
+        rows.append([
+            entry['date'],
+            Paragraph(_escape(_statement_particulars(entry)), cell),
+            f"{entry['debit']:.2f}" if entry['debit'] else '',
+            f"{entry['credit']:.2f}" if entry['credit'] else '',
+            f"{entry['balance']:.2f}",
+        ])
+    closing = entries[-1]['balance'] if entries else opening_balance
+    rows.append(['', 'Closing balance', '', '', f'{closing:.2f}'])
+
+    table = Table(rows, colWidths=[doc.width * w for w in STATEMENT_COLUMN_WIDTHS], repeatRows=1)
+    table.setStyle(TableStyle(styles['table'] + [
+        ('ALIGN', (0, 1), (0, -1), 'LEFT'),
+        ('ALIGN', (2, 1), (-1, -1), 'RIGHT'),
+        ('FONTNAME', (0, 1), (-1, 1), 'Helvetica-Bold'),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+    ]))
+    story.append(table)
+    doc.build(story)
+    return output.getvalue()
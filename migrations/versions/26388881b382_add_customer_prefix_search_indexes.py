@@ -0,0 +1,32 @@
+"""Add pattern indexes for customer prefix search
+
+Revision ID: 26388881b382
+Revises: 86f53a693d46
+Create Date: 2026-10-19 19:48:05.317620
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '26388881b382'
+down_revision = '86f53a693d46'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Under a non-C collation the plain btree indexes can't serve LIKE 'abc%';
+    # the pattern_ops indexes can. Other databases keep using idx_customer_name/phone.
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("CREATE INDEX IF NOT EXISTS idx_customer_name_lower_pattern ON customer (lower(name) text_pattern_ops)")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_customer_phone_pattern ON customer (phone varchar_pattern_ops)")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("DROP INDEX IF EXISTS idx_customer_phone_pattern")
+    op.execute("DROP INDEX IF EXISTS idx_customer_name_lower_pattern")
@@ -0,0 +1,37 @@
+"""Keep stock take and purchase order lines when their product is deleted
+
+Revision ID: 6b7f50e3fc23
+Revises: f83860a5b4bf
+Create Date: 2026-10-19 19:20:11.402871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6b7f50e3fc23'
+down_revision = 'f83860a5b4bf'
+branch_labels = None
+depends_on = None
+
+# The foreign keys were created unnamed; this matches PostgreSQL's default names
+# and names the reflected constraints the same way when SQLite rebuilds the table
+naming_convention = {'fk': '%(table_name)s_%(column_0_name)s_fkey'}
+
+
+def upgrade():
+    for table in ('stock_take_line', 'purchase_order_item'):
+        with op.batch_alter_table(table, schema=None, naming_convention=naming_convention) as batch_op:
+            batch_op.alter_column('product_id', existing_type=sa.Integer(), nullable=True)
+            batch_op.drop_constraint(f'{table}_product_id_fkey', type_='foreignkey')
+            batch_op.create_foreign_key(f'{table}_product_id_fkey', 'product', ['product_id'], ['id'], ondelete='SET NULL')
+
+
+def downgrade():
+    for table in ('purchase_order_item', 'stock_take_line'):
+        op.execute(f'DELETE FROM {table} WHERE product_id IS NULL')
+        with op.batch_alter_table(table, schema=None, naming_convention=naming_convention) as batch_op:
+            batch_op.drop_constraint(f'{table}_product_id_fkey', type_='foreignkey')
+            batch_op.create_foreign_key(f'{table}_product_id_fkey', 'product', ['product_id'], ['id'])
+            batch_op.alter_column('product_id', existing_type=sa.Integer(), nullable=False)
@@ -0,0 +1,31 @@
+"""Keep stock movements of deleted products
+
+Revision ID: 86f53a693d46
+Revises: 6b7f50e3fc23
+Create Date: 2026-10-19 19:34:52.118309
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '86f53a693d46'
+down_revision = '6b7f50e3fc23'
+branch_labels = None
+depends_on = None
+
+# The foreign key was created unnamed; this matches PostgreSQL's default name
+# and names the reflected constraint the same way when SQLite rebuilds the table
+naming_convention = {'fk': '%(table_name)s_%(column_0_name)s_fkey'}
+
+
+def upgrade():
+    with op.batch_alter_table('stock_movement', schema=None, naming_convention=naming_convention) as batch_op:
+        batch_op.drop_constraint('stock_movement_product_id_fkey', type_='foreignkey')
+
+
+def downgrade():
+    op.execute('DELETE FROM stock_movement WHERE product_id NOT IN (SELECT id FROM product)')
+    with op.batch_alter_table('stock_movement', schema=None, naming_convention=naming_convention) as batch_op:
+        batch_op.create_foreign_key('stock_movement_product_id_fkey', 'product', ['product_id'], ['id'], ondelete='CASCADE')
@@ -0,0 +1,30 @@
+"""Add trigram index for customer search
+
+Revision ID: b8fa12a5fbaa
+Revises: 63c076caa768
+Create Date: 2026-10-19 14:02:41.773915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8fa12a5fbaa'
+down_revision = '63c076caa768'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Fuzzy customer search uses pg_trgm; other databases fall back to LIKE
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_customer_name_trgm ON customer USING gin (name gin_trgm_ops)")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("DROP INDEX IF EXISTS idx_customer_name_trgm")
@@ -0,0 +1,366 @@
+"""Database models, plus the permission and first-run setup that only needs them"""
+from datetime import datetime, date
+from sqlalchemy import func
+from werkzeug.security import generate_password_hash
+from extensions import db
+
+# Models
+class Product(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    item_code = db.Column(db.String(20), unique=True, nullable=False)
+    description = db.Column(db.String(200), nullable=False)
+    tamil_name = db.Column(db.String(200))  # Optional Tamil name
+    uom = db.Column(db.String(10), nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    stock = db.Column(db.Integer, default=0)
+    restock_level = db.Column(db.Integer, default=0)  # Level at which to restock
+    stock_locations = db.Column(db.String(500))  # Comma-separated location tags
+    tags = db.Column(db.String(500))  # Comma-separated tags
+    notes = db.Column(db.Text)  # Product notes
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # Catalogue version
+
+    @property
+    def serialize(self):
+        return {
+            'id': self.id,
+            'item_code': self.item_code,
+            'description': self.description,
+            'tamil_name': self.tamil_name,
+            'uom': self.uom,
+            'price': self.price,
+            'stock': self.stock,
+            'restock_level': self.restock_level,
+            'stock_locations': self.stock_locations,
+            'tags': self.tags,
+            'notes': self.notes
+        }
+
+class DeletedProduct(db.Model):
+    """Tombstone so catalogue deltas can tell clients which products were removed"""
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+class StockTake(db.Model):
+    """A physical stock count; each line records what was expected, counted and adjusted"""
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    notes = db.Column(db.Text)
+    lines = db.relationship('StockTakeLine', backref='stock_take', lazy=True, cascade='all, delete-orphan')
+
+class StockTakeLine(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    stock_take_id = db.Column(db.Integer, db.ForeignKey('stock_take.id'), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id', ondelete='SET NULL'), index=True)  # None once the product is deleted
+    expected = db.Column(db.Integer, nullable=False)  # Product.stock when the count was applied
+    counted = db.Column(db.Integer, nullable=False)
+    variance = db.Column(db.Integer, nullable=False)  # counted - expected, the adjustment applied
+
+class StockMovement(db.Model):
+    """Append-only record of every stock change; Product.stock is their running total"""
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, nullable=False)  # No foreign key: the history outlives deleted products
+    quantity = db.Column(db.Integer, nullable=False)  # Signed change in stock
+    reason = db.Column(db.String(20), nullable=False)  # One of STOCK_MOVEMENT_REASONS
+    reference_id = db.Column(db.Integer)  # Invoice, stock take or purchase order id, depending on reason
+    user_id = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    __table_args__ = (db.Index('ix_stock_movement_product_created', 'product_id', 'created_at'),)
+
+class StockCheckpoint(db.Model):
+    """Stock of a product at a point in time, so history queries only scan later movements"""
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id', ondelete='CASCADE'), primary_key=True)
+    taken_at = db.Column(db.DateTime, primary_key=True)
+    stock = db.Column(db.Integer, nullable=False)
+
+class Customer(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False)
+    phone = db.Column(db.String(20))
+    email = db.Column(db.String(120))
+    address = db.Column(db.Text)
+    balance = db.Column(db.Float, default=0.0)  # Positive means customer owes money, negative means surplus
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    invoices = db.relationship('Invoice', backref='customer', lazy=True)
+    transactions = db.relationship('CustomerTransaction', backref='customer', lazy=True)
+    receivables = db.relationship('CustomerReceivable', backref='customer', lazy=True)
+
+    @staticmethod
+    def adjust_balance(customer_id, delta):
+        """Apply a ledger change to the stored balance atomically in SQL (balance = balance + delta)"""
+        if not delta:
+            return
+        db.session.execute(
+            db.update(Customer)
+            .where(Customer.id == customer_id)
+            .values(balance=func.round(db.cast(func.coalesce(Customer.balance, 0) + delta, db.Numeric), 2))
+            .execution_options(synchronize_session='fetch')
+        )
+
+    @staticmethod
+    def adjust_balances(deltas):
+        """Apply ledger changes for many customers ({customer_id: delta}) in a single UPDATE"""
+        deltas = {customer_id: delta for customer_id, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        db.session.execute(
+            db.update(Customer)
+            .where(Customer.id.in_(deltas))
+            .values(balance=func.round(db.cast(
+                func.coalesce(Customer.balance, 0) + db.case(deltas, value=Customer.id, else_=0), db.Numeric
+            ), 2))
+            .execution_options(synchronize_session='fetch')
+        )
+
+class CustomerTransaction(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
+    date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    amount = db.Column(db.Float, nullable=False)
+    transaction_type = db.Column(db.String(20), nullable=False)  # 'payment' or 'refund'
+    payment_method = db.Column(db.String(50))  # 'cash', 'card', 'upi', etc.
+    notes = db.Column(db.Text)
+    reference_number = db.Column(db.String(50))  # For tracking payment references
+
+    @staticmethod
+    def balance_effect(transaction_type, amount):
+        """How a transaction moves the customer balance: payments reduce it, refunds increase it"""
+        if transaction_type == 'payment':
+            return -amount
+        if transaction_type == 'refund':
+            return amount
+        return 0
+
+class CustomerReceivable(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    notes = db.Column(db.Text, nullable=False)
+    date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    invoice_id = db.Column(db.Integer, db.ForeignKey('invoice.id'))  # Optional, for linked invoices
+    additional_amount = db.Column(db.Float, default=0.0)  # For additional amounts on linked invoices
+    paid_amount = db.Column(db.Float, default=0.0)  # Payments allocated to this receivable (FIFO)
+    
+    # Remove the duplicate backref and use foreign_keys for clarity
+    invoice = db.relationship('Invoice', backref='receivable')
+
+class Invoice(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    order_number = db.Column(db.String(3), nullable=False)  # Daily 3-digit number
+    date = db.Column(db.Date, nullable=False, default=date.today)
+    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'))
+    customer_name = db.Column(db.String(200))
+    total_amount = db.Column(db.Float, default=0.0)
+    total_items = db.Column(db.Integer, default=0)
+    items = db.relationship('InvoiceItem', backref='invoice', lazy=True, cascade="all, delete-orphan")
+    payment_status = db.Column(db.String(20), default='pending')  # pending, partial, paid
+    paid_amount = db.Column(db.Float, default=0.0)  # Payments allocated to this invoice (FIFO)
+    client_key = db.Column(db.String(64), unique=True)  # Idempotency key for invoices captured offline
+
+    @classmethod
+    def generate_order_number(cls):
+        # Get the latest invoice for today
+        today = date.today()
+        latest_invoice = cls.query.filter(
+            func.date(cls.date) == today
+        ).order_by(cls.id.desc()).first()
+        
+        if latest_invoice:
+            last_number = int(latest_invoice.order_number)
+            new_number = str(last_number + 1).zfill(3)
+        else:
+            new_number = '001'
+        
+        return new_number
+
+class InvoiceItem(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    invoice_id = db.Column(db.Integer, db.ForeignKey('invoice.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    product = db.relationship('Product', backref='invoice_items')
+
+class PrintTemplate(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    type = db.Column(db.String(20), nullable=False)  # 'invoice' or 'summary'
+    content = db.Column(db.Text, nullable=False)
+    is_default = db.Column(db.Boolean, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# Models
+class Permission(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)
+    description = db.Column(db.String(200))
+
+# User-Permission association table
+user_permissions = db.Table('user_permissions',
+    db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
+    db.Column('permission_id', db.Integer, db.ForeignKey('permission.id'), primary_key=True)
+)
+
+class User(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(80), unique=True, nullable=False)
+    password = db.Column(db.String(255), nullable=False)  # Increased length for hashed password
+    role = db.Column(db.String(20), nullable=False, default='user')
+    totp_secret = db.Column(db.String(32))
+    totp_enabled = db.Column(db.Boolean, default=False)
+    permission_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Bumped when role or permissions change
+    permissions = db.relationship('Permission', secondary=user_permissions, lazy='subquery',
+        backref=db.backref('users', lazy=True))
+
+    def verify_totp(self, token):
+        if not self.totp_enabled or not self.totp_secret:
+            return True
+        from pyotp import TOTP
+        totp = TOTP(self.totp_secret)
+        return totp.verify(token)
+
+    def has_permission(self, permission_name):
+        if self.role == 'admin':  # Admin has all permissions
+            return True
+        return any(p.name == permission_name for p in self.permissions)
+
+    def has_any_permission(self, permission_names):
+        if self.role == 'admin':  # Admin has all permissions
+            return True
+        return any(p.name in permission_names for p in self.permissions)
+
+# Function to initialize default permissions
+def init_permissions():
+    default_permissions = [
+        ('view_customers', 'Can view customers list and details'),
+        ('edit_customers', 'Can create, edit and delete customers'),
+        ('view_invoices', 'Can view invoices'),
+        ('create_invoices', 'Can create new invoices'),
+        ('edit_invoices', 'Can edit existing invoices'),
+        ('delete_invoices', 'Can delete invoices'),
+        ('view_products', 'Can view products list'),
+        ('edit_products', 'Can create, edit and delete products'),
+        ('import_products', 'Can import products from Excel/CSV'),
+        ('export_products', 'Can export products to Excel/CSV'),
+        ('manage_stock', 'Can update product stock levels'),
+        ('delete_products', 'Can delete products'),
+        # Product field-specific permissions
+        ('view_product_code', 'Can view product item codes'),
+        ('edit_product_code', 'Can edit product item codes'),
+        ('view_product_description', 'Can view product descriptions'),
+        ('edit_product_description', 'Can edit product descriptions'),
+        ('view_product_tamil', 'Can view product Tamil names'),
+        ('edit_product_tamil', 'Can edit product Tamil names'),
+        ('view_product_uom', 'Can view product UOM'),
+        ('edit_product_uom', 'Can edit product UOM'),
+        ('view_product_price', 'Can view product prices'),
+        ('edit_product_price', 'Can edit product prices'),
+        ('view_product_stock', 'Can view product stock levels'),
+        ('view_invoice_stock', 'Can view stock in invoice search dropdown'),
+        ('edit_product_stock', 'Can edit product stock levels'),
+        ('view_product_restock', 'Can view product restock levels'),
+        ('edit_product_restock', 'Can edit product restock levels'),
+        ('view_product_locations', 'Can view product locations'),
+        ('edit_product_locations', 'Can edit product locations'),
+        ('view_product_tags', 'Can view product tags'),
+        ('edit_product_tags', 'Can edit product tags'),
+        ('view_product_notes', 'Can view product notes'),
+        ('edit_product_notes', 'Can edit product notes'),
+        ('view_product_suppliers', 'Can view product suppliers'),
+        ('manage_settings', 'Can manage system settings'),
+        ('manage_users', 'Can manage users'),
+        ('view_suppliers', 'Can view suppliers list'),
+        ('edit_suppliers', 'Can create, edit and delete suppliers')
+    ]
+    
+    for name, description in default_permissions:
+        if not Permission.query.filter_by(name=name).first():
+            permission = Permission(name=name, description=description)
+            db.session.add(permission)
+    
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error initializing permissions: {str(e)}")
+
+class Settings(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    calculator_code = db.Column(db.String(20), default='9999')
+    wallpaper_path = db.Column(db.String(200))  # Path to the wallpaper file
+
+# Models
+class Supplier(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False)
+    phone = db.Column(db.String(20))
+    email = db.Column(db.String(120))
+    address = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    products = db.relationship('Product', secondary='supplier_products', backref='suppliers')
+
+# Association table for supplier-product relationship
+supplier_products = db.Table('supplier_products',
+    db.Column('supplier_id', db.Integer, db.ForeignKey('supplier.id'), primary_key=True),
+    db.Column('product_id', db.Integer, db.ForeignKey('product.id'), primary_key=True),
+    db.Column('supplier_price', db.Float)  # Latest price from the supplier's price list
+)
+
+class PurchaseOrder(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    supplier_id = db.Column(db.Integer, db.ForeignKey('supplier.id'), nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False, default='draft', index=True)  # draft, ordered, received, cancelled
+    notes = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    received_at = db.Column(db.DateTime)
+    supplier = db.relationship('Supplier', backref='purchase_orders')
+    items = db.relationship('PurchaseOrderItem', backref='purchase_order', lazy=True, cascade='all, delete-orphan')
+
+class PurchaseOrderItem(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    purchase_order_id = db.Column(db.Integer, db.ForeignKey('purchase_order.id'), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id', ondelete='SET NULL'), index=True)  # None once the product is deleted
+    quantity = db.Column(db.Integer, nullable=False)  # Suggested, then ordered quantity
+    received_quantity = db.Column(db.Integer)
+    unit_price = db.Column(db.Float)  # Supplier price when the order was drafted
+    product = db.relationship('Product')
+
+# Create tables and add sample data
+def init_db():
+    """Create tables, permissions, the admin user and settings (run inside an app context)"""
+    try:
+        # Create all tables
+        db.create_all()
+        
+        # Initialize permissions first
+        init_permissions()
+        
+        # Create admin user if none exists
+        admin_user = User.query.filter_by(role='admin').first()
+        if not admin_user:
+            admin_user = User(
+                username='admin',
+                password=generate_password_hash('admin'),
+                role='admin'
+            )
+            db.session.add(admin_user)
+            db.session.commit()
+            print("Admin user created successfully")
+
+        # Initialize settings if not exists
+        settings = Settings.query.first()
+        if not settings:
+            settings = Settings(calculator_code='9999')
+            db.session.add(settings)
+            db.session.commit()
+            
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error in init_db: {str(e)}")
+        raise
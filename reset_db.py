@@ -1,6 +1,10 @@
-from app import app, db, User, Permission, init_db
+from app import create_app
+from extensions import db
+from models import User, Permission, init_db
 import os
 
+app = create_app(register_blueprints=False)
+
 def reset_database():
     try:
         # Get the database file path
@@ -2,11 +2,15 @@ import os
 import sys
 import subprocess
 from dotenv import load_dotenv
-from app import app, db, User, Permission
+from app import create_app
+from extensions import db
+from models import User, Permission
 from werkzeug.security import generate_password_hash
 import psycopg2
 from sqlalchemy import text, inspect
 
+app = create_app(register_blueprints=False)
+
 # Load environment variables
 load_dotenv()
 
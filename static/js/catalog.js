@@ -0,0 +1,115 @@
+// Client-side product catalogue for invoice entry.
+// The full catalogue is fetched once from /products/catalog, kept in IndexedDB and
+// kept current with /products/catalog/delta, so product search doesn't hit the server.
+const CATALOG_DB_NAME = 'inventory-catalog';
+const CATALOG_STORE = 'catalog';
+const SEARCH_FIELDS = ['item_code', 'description', 'tamil_name', 'stock_locations', 'tags', 'notes', 'uom'];
+
+let productCatalog = null;  // {version, products: Map of id -> product}
+
+function openCatalogDb() {
+    return new Promise((resolve, reject) => {
+        const request = indexedDB.open(CATALOG_DB_NAME, 1);
+        request.onupgradeneeded = () => request.result.createObjectStore(CATALOG_STORE);
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+}
+
+function readStoredCatalog() {
+    return openCatalogDb().then(db => new Promise((resolve, reject) => {
+        const request = db.transaction(CATALOG_STORE, 'readonly').objectStore(CATALOG_STORE).get('products');
+        request.onsuccess = () => resolve(request.result || null);
+        request.onerror = () => reject(request.error);
+    }));
+}
+
+function storeCatalog(catalog) {
+    const stored = { version: catalog.version, products: Array.from(catalog.products.values()) };
+    return openCatalogDb().then(db => new Promise((resolve, reject) => {
+        const tx = db.transaction(CATALOG_STORE, 'readwrite');
+        tx.objectStore(CATALOG_STORE).put(stored, 'products');
+        tx.oncomplete = () => resolve();
+        tx.onerror = () => reject(tx.error);
+    }));
+}
+
+// Turn the server's columnar payload ({fields, columns}) into product objects
+function rowsFromColumns(fields, columns) {
+    const count = columns.length ? columns[0].length : 0;
+    const products = [];
+    for (let i = 0; i < count; i++) {
+        const product = {};
+        fields.forEach((field, f) => { product[field] = columns[f][i]; });
+        products.push(product);
+    }
+    return products;
+}
+
+function fetchCatalogSnapshot() {
+    return fetch('/products/catalog', { credentials: 'same-origin' })
+        .then(response => response.json())
+        .then(data => ({
+            version: data.version,
+            products: new Map(rowsFromColumns(data.fields, data.columns).map(p => [p.id, p]))
+        }));
+}
+
+function applyCatalogDelta(catalog) {
+    return fetch(`/products/catalog/delta?since=${encodeURIComponent(catalog.version)}`, { credentials: 'same-origin' })
+        .then(response => response.json())
+        .then(data => {
+            if (data.reset) {
+                return fetchCatalogSnapshot();
+            }
+            rowsFromColumns(data.fields, data.columns).forEach(p => catalog.products.set(p.id, p));
+            data.deleted.forEach(id => catalog.products.delete(id));
+            catalog.version = data.version;
+            return catalog;
+        });
+}
+
+// Load the cached catalogue and bring it up to date; safe to call repeatedly
+function refreshCatalog() {
+    const start = productCatalog
+        ? Promise.resolve(productCatalog)
+        : readStoredCatalog().then(stored => stored && {
+            version: stored.version,
+            products: new Map(stored.products.map(p => [p.id, p]))
+        });
+
+    return start
+        .then(catalog => catalog ? applyCatalogDelta(catalog) : fetchCatalogSnapshot())
+        .then(catalog => {
+            productCatalog = catalog;
+            return storeCatalog(catalog).then(() => catalog);
+        })
+        .catch(error => console.error('Error refreshing product catalogue:', error));
+}
+
+// Same matching as /products/search: every term must appear in one of the fields
+function searchProducts(query) {
+    const terms = query.toLowerCase().split(/\s+/).filter(term => term);
+    if (!productCatalog) {
+        return fetch(`/products/search?q=${encodeURIComponent(query)}`).then(response => response.json());
+    }
+    if (!terms.length) {
+        return Promise.resolve([]);
+    }
+
+    const matches = [];
+    productCatalog.products.forEach(product => {
+        const matchesAll = terms.every(term => SEARCH_FIELDS.some(field =>
+            product[field] && String(product[field]).toLowerCase().includes(term)
+        ));
+        if (matchesAll) {
+            matches.push(Object.assign({}, product, {
+                stock_locations_display: product.stock_locations || '',
+                tags_display: product.tags || '',
+                notes_display: product.notes || ''
+            }));
+        }
+    });
+    matches.sort((a, b) => (a.item_code < b.item_code ? -1 : a.item_code > b.item_code ? 1 : 0));
+    return Promise.resolve(matches);
+}
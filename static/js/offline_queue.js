@@ -0,0 +1,71 @@
+// Queue of invoices captured while offline, shared by pages and the service worker.
+// Each invoice keeps the client_key the page first posted it with (or gets one here),
+// so /invoices/sync can safely be retried and never duplicates a saved invoice.
+const OFFLINE_DB_NAME = 'inventory-offline';
+const OFFLINE_STORE = 'pending-invoices';
+const SYNC_BATCH_SIZE = 50;
+
+function openOfflineDb() {
+    return new Promise((resolve, reject) => {
+        const request = indexedDB.open(OFFLINE_DB_NAME, 1);
+        request.onupgradeneeded = () => {
+            request.result.createObjectStore(OFFLINE_STORE, { keyPath: 'client_key' });
+        };
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+}
+
+function offlineTransaction(mode, callback) {
+    return openOfflineDb().then(db => new Promise((resolve, reject) => {
+        const tx = db.transaction(OFFLINE_STORE, mode);
+        const result = callback(tx.objectStore(OFFLINE_STORE));
+        tx.oncomplete = () => resolve(result && result.result !== undefined ? result.result : undefined);
+        tx.onerror = () => reject(tx.error);
+    }));
+}
+
+function queueInvoice(invoice) {
+    const queued = Object.assign({}, invoice, {
+        client_key: invoice.client_key || crypto.randomUUID(),
+        queued_at: new Date().toISOString()
+    });
+    return offlineTransaction('readwrite', store => store.put(queued)).then(() => queued);
+}
+
+function getQueuedInvoices() {
+    return offlineTransaction('readonly', store => store.getAll()).then(invoices => invoices || []);
+}
+
+function removeQueuedInvoices(keys) {
+    return offlineTransaction('readwrite', store => keys.forEach(key => store.delete(key)));
+}
+
+// Push queued invoices to the server in batches; returns the sync results
+function flushQueuedInvoices() {
+    return getQueuedInvoices().then(invoices => {
+        const batches = [];
+        for (let i = 0; i < invoices.length; i += SYNC_BATCH_SIZE) {
+            batches.push(invoices.slice(i, i + SYNC_BATCH_SIZE));
+        }
+        return batches.reduce((previous, batch) => previous.then(allResults =>
+            fetch('/invoices/sync', {
+                method: 'POST',
+                credentials: 'same-origin',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ invoices: batch })
+            })
+            .then(response => response.json())
+            .then(data => {
+                if (!data.success) {
+                    throw new Error(data.error || 'Sync failed');
+                }
+                // Created and duplicate invoices are on the server; errors stay queued
+                const done = data.results
+                    .filter(result => result.status !== 'error')
+                    .map(result => result.client_key);
+                return removeQueuedInvoices(done).then(() => allResults.concat(data.results));
+            })
+        ), Promise.resolve([]));
+    });
+}
@@ -0,0 +1,159 @@
+"""Stock ledger: atomic stock changes, movements and checkpoints"""
+from flask import jsonify, session, has_request_context
+from datetime import datetime, timedelta
+from sqlalchemy import func
+import os
+from extensions import db
+from models import Product, StockMovement, StockCheckpoint
+
+STOCK_MOVEMENT_REASONS = ('opening', 'sale', 'invoice_edit', 'invoice_delete', 'adjustment', 'import', 'stock_take', 'purchase_receipt', 'product_delete')
+
+def _record_stock_movements(movements, reason):
+    """Append StockMovements for changes made to Product.stock.
+    
+    movements maps a reference id (or None) to that reference's {product_id: delta}.
+    """
+    now = datetime.utcnow()
+    user_id = session.get('user_id') if has_request_context() else None
+    rows = [
+        {'product_id': product_id, 'quantity': delta, 'reason': reason, 'reference_id': reference_id, 'user_id': user_id, 'created_at': now}
+        for reference_id, deltas in movements.items() for product_id, delta in deltas.items() if delta
+    ]
+    if rows:
+        db.session.execute(db.insert(StockMovement), rows)
+
+def _record_closing_movements(*criteria):
+    """Take the remaining stock of products matching criteria out of the ledger before they are deleted.
+    
+    A deleted product then nets to zero, so stock_as_of stays right for past
+    dates when a restore brings the same product id back.
+    """
+    now = datetime.utcnow()
+    user_id = session.get('user_id') if has_request_context() else None
+    db.session.execute(
+        db.insert(StockMovement).from_select(
+            ['product_id', 'quantity', 'reason', 'user_id', 'created_at'],
+            db.select(
+                Product.id, -Product.stock, db.literal('product_delete'),
+                db.literal(user_id, db.Integer), db.literal(now, db.DateTime)
+            ).where(Product.stock != 0, *criteria)
+        )
+    )
+
+# What to do when a decrement would take stock below zero: allow, warn or reject
+STOCK_OVERSELL_POLICY = os.getenv('STOCK_OVERSELL_POLICY', 'warn')
+
+class InsufficientStockError(Exception):
+    """Raised under the reject policy when products don't have enough stock"""
+    def __init__(self, product_ids):
+        self.product_ids = product_ids
+        super().__init__(f'Insufficient stock for products {product_ids}')
+
+def _apply_stock_deltas(deltas, reason, reference_id=None, movements=None, policy=None):
+    """Apply net stock changes ({product_id: delta}) to all products in a single UPDATE.
+    
+    The change is computed by the database (stock = stock + delta), so concurrent
+    sales never overwrite each other. Under the reject policy the UPDATE is
+    conditional on stock + delta >= 0 for decrements and InsufficientStockError
+    is raised if any product fell short; the caller rolls back. Returns the ids
+    of products a decrement left below zero (allow and warn policies).
+    
+    The stock movements are written in the same transaction, one per product
+    against reference_id, or as broken down in movements ({reference_id: deltas})
+    when one UPDATE covers several documents.
+    """
+    deltas = {product_id: delta for product_id, delta in deltas.items() if delta}
+    if not deltas:
+        return []
+    policy = policy or STOCK_OVERSELL_POLICY
+    
+    change = db.case(deltas, value=Product.id, else_=0)
+    new_stock = func.coalesce(Product.stock, 0) + change
+    statement = db.update(Product).where(Product.id.in_(deltas))
+    if policy == 'reject':
+        statement = statement.where(db.or_(change >= 0, new_stock >= 0))
+    rows = db.session.execute(
+        statement.values(stock=new_stock)
+        .returning(Product.id, Product.stock)
+        .execution_options(synchronize_session='fetch')
+    ).all()
+    
+    if policy == 'reject' and len(rows) < len(deltas):
+        raise InsufficientStockError(sorted(set(deltas) - {row.id for row in rows}))
+    
+    _record_stock_movements(movements or {reference_id: deltas}, reason)
+    
+    oversold = sorted(row.id for row in rows if row.stock < 0 and deltas[row.id] < 0)
+    if oversold and policy == 'warn':
+        print(f"Stock below zero after {reason} {reference_id or ''}: products {oversold}")
+    return oversold
+
+def _stock_error_response(error):
+    """JSON error naming the products that don't have enough stock"""
+    codes = [code for code, in db.session.query(Product.item_code).filter(Product.id.in_(error.product_ids)).order_by(Product.item_code)]
+    return jsonify({'success': False, 'error': f"Insufficient stock for {', '.join(codes)}", 'insufficient_stock': codes})
+
+def _stock_warnings(product_ids):
+    """Item codes of oversold products, for the warn policy's response"""
+    if not product_ids or STOCK_OVERSELL_POLICY != 'warn':
+        return []
+    return [code for code, in db.session.query(Product.item_code).filter(Product.id.in_(product_ids)).order_by(Product.item_code)]
+
+def stock_as_of(as_of):
+    """Query of (product_id, stock) for every product at the moment as_of.
+    
+    Products with a checkpoint at or before as_of start from the latest one and
+    add the movements since; products without one start from the current stock
+    and take back the movements made after as_of.
+    """
+    latest = db.session.query(
+        StockCheckpoint.product_id,
+        func.max(StockCheckpoint.taken_at).label('taken_at')
+    ).filter(StockCheckpoint.taken_at <= as_of).group_by(StockCheckpoint.product_id).subquery()
+    checkpoint = db.aliased(StockCheckpoint)
+    
+    delta = func.coalesce(func.sum(
+        db.case((latest.c.taken_at.is_(None), -StockMovement.quantity), else_=StockMovement.quantity)
+    ), 0)
+    return db.session.query(
+        Product.id.label('product_id'),
+        (func.coalesce(func.max(checkpoint.stock), func.max(func.coalesce(Product.stock, 0))) + delta).label('stock')
+    ).outerjoin(latest, latest.c.product_id == Product.id).outerjoin(
+        checkpoint, db.and_(checkpoint.product_id == latest.c.product_id, checkpoint.taken_at == latest.c.taken_at)
+    ).outerjoin(StockMovement, db.and_(
+        StockMovement.product_id == Product.id,
+        db.or_(
+            db.and_(latest.c.taken_at.isnot(None), StockMovement.created_at > latest.c.taken_at, StockMovement.created_at <= as_of),
+            db.and_(latest.c.taken_at.is_(None), StockMovement.created_at > as_of)
+        )
+    )).group_by(Product.id)
+
+STOCK_CHECKPOINT_LAG = timedelta(minutes=5)  # Leave in-flight transactions out of a checkpoint
+
+def checkpoint_stock():
+    """Checkpoint every product whose stock moved since its last checkpoint.
+    
+    Checkpoints are derived from the ledger (stock_as_of) at a moment slightly in
+    the past, so movements still being committed can't fall between two
+    checkpoints. Returns the number of checkpoints written; the caller commits.
+    """
+    taken_at = datetime.utcnow() - STOCK_CHECKPOINT_LAG
+    last = db.session.query(
+        StockCheckpoint.product_id,
+        func.max(StockCheckpoint.taken_at).label('taken_at')
+    ).group_by(StockCheckpoint.product_id).subquery()
+    moved = db.session.query(StockMovement.product_id).outerjoin(
+        last, last.c.product_id == StockMovement.product_id
+    ).filter(
+        StockMovement.created_at <= taken_at,
+        db.or_(last.c.taken_at.is_(None), StockMovement.created_at > last.c.taken_at)
+    ).distinct()
+    
+    current = stock_as_of(taken_at).filter(Product.id.in_(moved)).subquery()
+    result = db.session.execute(
+        db.insert(StockCheckpoint).from_select(
+            ['product_id', 'taken_at', 'stock'],
+            db.select(current.c.product_id, db.literal(taken_at, db.DateTime), current.c.stock)
+        )
+    )
+    return result.rowcount
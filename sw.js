@@ -1,14 +1,16 @@
-const CACHE_NAME = 'inventory-system-v1';
-const STATIC_CACHE = 'static-v1';
-const DYNAMIC_CACHE = 'dynamic-v1';
+importScripts('/static/js/offline_queue.js');
+
+const CACHE_NAME = 'inventory-system-v2';
+const STATIC_CACHE = 'static-v2';
+const DYNAMIC_CACHE = 'dynamic-v2';
 const OFFLINE_URL = '/offline.html';
 
 // Assets that should be cached immediately during installation
 const CORE_ASSETS = [
     '/',
     '/offline.html',
-    '/static/manifest.json',
-    '/static/sw.js',
+    '/manifest.json',
+    '/static/js/offline_queue.js',
     '/static/icons/icon-512x512.png'
 ];
 
@@ -95,6 +97,11 @@ self.addEventListener('fetch', (event) => {
         return;
     }
 
+    // Only GET responses can be cached; saves and syncs go straight to the network
+    if (event.request.method !== 'GET') {
+        return;
+    }
+
     // Network-first strategy for dynamic routes and API calls
     if (shouldNetworkFirst(event.request.url)) {
         event.respondWith(
@@ -159,6 +166,10 @@ self.addEventListener('fetch', (event) => {
 });
 
 // Background sync for offline actions
+function syncInvoices() {
+    return flushQueuedInvoices();
+}
+
 self.addEventListener('sync', (event) => {
     if (event.tag === 'sync-invoices') {
         event.waitUntil(syncInvoices());
@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """App on a fresh SQLite database with the tables, permissions and admin user created"""
+    monkeypatch.setenv('FLASK_ENV', 'production')
+    monkeypatch.setenv('SQLALCHEMY_DATABASE_URI', 'sqlite:///' + str(tmp_path / 'test.db'))
+    from app import create_app
+    from extensions import db
+    from models import init_db
+
+    app = create_app()
+    app.config['TESTING'] = True
+    monkeypatch.setattr('extensions.cache._cache', {})  # Cached lookups from a previous test's database
+    with app.app_context():
+        init_db()
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    """Test client signed in as the admin user"""
+    from models import Permission, User
+
+    client = app.test_client()
+    admin = User.query.filter_by(role='admin').first()
+    with client.session_transaction() as session:
+        session['user_id'] = admin.id
+        session['logged_in'] = True
+        session['is_admin'] = True
+        session['permissions'] = [p.name for p in Permission.query.all()]
+    return client
@@ -0,0 +1,18 @@
+from blueprints.customers import reconcile_customer_balances
+from extensions import db
+from models import Customer, CustomerReceivable
+
+
+def test_reconcile_fix_corrects_drift(app):
+    customer = Customer(name='Alice', phone='9876', balance=75.0)
+    db.session.add(customer)
+    db.session.flush()
+    db.session.add(CustomerReceivable(customer_id=customer.id, amount=50.0, notes=''))
+    db.session.commit()
+
+    report = reconcile_customer_balances(fix=True)
+
+    assert [entry['difference'] for entry in report['drift']] == [25.0]
+    db.session.expire_all()
+    assert db.session.get(Customer, customer.id).balance == 50.0
+    assert reconcile_customer_balances()['drift'] == []
@@ -0,0 +1,25 @@
+from datetime import date
+
+from extensions import db
+from invoice_pdf import BATCH_CHUNK_SIZE
+from models import Invoice
+
+
+def test_tamil_batch_without_font_returns_503(client, tmp_path, monkeypatch):
+    monkeypatch.setenv('TAMIL_FONT_PATH', str(tmp_path / 'missing.ttf'))
+    for number in range(1, BATCH_CHUNK_SIZE + 3):
+        db.session.add(Invoice(order_number=f'{number:03d}', date=date(2024, 1, 1), customer_name='Alice',
+                               total_amount=10.0, total_items=1))
+    db.session.commit()
+
+    response = client.get('/invoices/print_batch_pdf?lang=ta')
+
+    assert response.status_code == 503
+    assert 'Tamil font not found' in response.get_json()['error']
+
+
+def test_batch_pdf_rejects_bad_dates(client):
+    response = client.get('/invoices/print_batch_pdf?start_date=01-01-2024')
+
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Dates must be in YYYY-MM-DD format'
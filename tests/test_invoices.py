@@ -0,0 +1,82 @@
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import Customer, CustomerReceivable, Invoice, Product
+
+
+def _product_and_customer():
+    product = Product(item_code='P1', description='Widget', uom='PCS', price=10.0, stock=100)
+    customer = Customer(name='Alice', phone='9876')
+    db.session.add_all([product, customer])
+    db.session.commit()
+    return product.id, customer.id
+
+
+def _queued_invoice(client_key, product_id, **fields):
+    return dict({
+        'client_key': client_key,
+        'date': '2024-01-01',
+        'customer_name': 'Walk-in',
+        'total_amount': 20.0,
+        'total_items': 1,
+        'items': [{'product_id': product_id, 'quantity': 2, 'price': 10.0, 'amount': 20.0}]
+    }, **fields)
+
+
+def test_sync_links_invoice_to_customer(client):
+    product_id, customer_id = _product_and_customer()
+
+    response = client.post('/invoices/sync', json={'invoices': [
+        _queued_invoice('key-1', product_id, customer_id=customer_id)
+    ]})
+
+    result, = response.get_json()['results']
+    assert result['status'] == 'created'
+    invoice = db.session.get(Invoice, result['id'])
+    assert invoice.customer_id == customer_id
+    assert invoice.customer_name == 'Alice'
+    receivable = CustomerReceivable.query.filter_by(invoice_id=invoice.id).one()
+    assert receivable.customer_id == customer_id
+    assert receivable.amount == 20.0
+    assert db.session.get(Customer, customer_id).balance == 20.0
+
+
+def test_sync_rejects_unknown_customer(client):
+    product_id, customer_id = _product_and_customer()
+
+    response = client.post('/invoices/sync', json={'invoices': [
+        _queued_invoice('key-1', product_id, customer_id=customer_id + 1)
+    ]})
+
+    result, = response.get_json()['results']
+    assert result['status'] == 'error'
+    assert Invoice.query.count() == 0
+    assert CustomerReceivable.query.count() == 0
+
+
+def test_sync_reports_malformed_entries_per_invoice(client):
+    product_id, _ = _product_and_customer()
+
+    response = client.post('/invoices/sync', json={'invoices': [
+        'not an invoice',
+        _queued_invoice('key-1', product_id, date='01/01/2024'),
+        _queued_invoice('key-2', product_id)
+    ]})
+
+    assert response.status_code == 200
+    statuses = [result['status'] for result in response.get_json()['results']]
+    assert sorted(statuses) == ['created', 'error', 'error']
+    assert Invoice.query.count() == 1
+
+
+def test_sync_only_retries_client_key_conflicts(client, monkeypatch):
+    product_id, _ = _product_and_customer()
+
+    def fail(*args, **kwargs):
+        raise IntegrityError('INSERT', {}, Exception('FOREIGN KEY constraint failed'))
+    monkeypatch.setattr('blueprints.invoices._apply_stock_deltas', fail)
+
+    response = client.post('/invoices/sync', json={'invoices': [_queued_invoice('key-1', product_id)]})
+
+    assert response.status_code == 500
+    assert Invoice.query.count() == 0
@@ -0,0 +1,20 @@
+from extensions import db
+from models import Product
+
+
+def test_stock_take_reports_non_finite_counts_per_row(client):
+    db.session.add(Product(item_code='P1', description='Widget', uom='PCS', price=10.0, stock=10))
+    db.session.commit()
+
+    response = client.post('/stock-takes', json={'counts': [
+        {'item_code': 'P1', 'counted': 'inf'},
+        {'item_code': 'P1', 'counted': 'nan'},
+        {'item_code': 'P1', 'counted': '1e400'},
+        {'item_code': 'P1', 'counted': '7'}
+    ]})
+
+    body = response.get_json()
+    assert body['success'] is True
+    assert [error['row'] for error in body['errors']] == [1, 2, 3]
+    db.session.expire_all()
+    assert Product.query.one().stock == 7
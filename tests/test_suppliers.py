@@ -0,0 +1,50 @@
+from extensions import db
+from models import Product, PurchaseOrder, PurchaseOrderItem, Supplier
+
+
+def _supplier_with_order(status):
+    supplier = Supplier(name='Acme')
+    product = Product(item_code='P1', description='Widget', uom='PCS', price=10.0, stock=0)
+    db.session.add_all([supplier, product])
+    db.session.flush()
+    order = PurchaseOrder(supplier_id=supplier.id, status=status)
+    order.items.append(PurchaseOrderItem(product_id=product.id, quantity=5, unit_price=8.0))
+    db.session.add(order)
+    db.session.commit()
+    return supplier.id, order.id
+
+
+def test_delete_supplier_removes_draft_orders(client):
+    supplier_id, order_id = _supplier_with_order('draft')
+
+    response = client.delete(f'/suppliers/{supplier_id}')
+
+    assert response.status_code == 200
+    assert response.get_json()['success'] is True
+    assert db.session.get(Supplier, supplier_id) is None
+    assert db.session.get(PurchaseOrder, order_id) is None
+    assert PurchaseOrderItem.query.count() == 0
+
+
+def test_delete_supplier_keeps_received_orders(client):
+    supplier_id, order_id = _supplier_with_order('received')
+
+    response = client.delete(f'/suppliers/{supplier_id}')
+
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+    assert db.session.get(Supplier, supplier_id) is not None
+    assert db.session.get(PurchaseOrder, order_id) is not None
+
+
+def test_receive_purchase_order_adds_stock_once(client):
+    _, order_id = _supplier_with_order('ordered')
+
+    first = client.post(f'/purchase-orders/{order_id}/receive', json={})
+    second = client.post(f'/purchase-orders/{order_id}/receive', json={})
+
+    assert first.get_json()['success'] is True
+    assert second.get_json()['success'] is False
+    db.session.expire_all()
+    assert Product.query.one().stock == 5
+    assert db.session.get(PurchaseOrder, order_id).status == 'received'